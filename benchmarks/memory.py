@@ -0,0 +1,63 @@
+"""
+Compare the memory used per model instance with field values stored in
+slots (the default) and in the instance `__dict__`.
+
+    python benchmarks/memory.py [instances]
+
+The `__dict__` layout is a plain class storing the same `_prop__<name>`
+attributes in its instance `__dict__`, as models did before slots were
+generated. A model declaring `__slots__ = ('__dict__',)` is larger, it
+also carries the slots every model has for deferred loading and
+prefetching.
+"""
+
+import sys
+import datetime
+import tracemalloc
+
+from mangrove import models
+from mangrove import fields
+
+
+class Event(models.Model):
+    name = fields.StringField()
+    count = fields.IntegerField()
+    value = fields.FloatField()
+    created = fields.DateTimeField()
+
+
+class DictEvent(object):
+    # field values stored in `__dict__` like before slots were generated
+    def __init__(self, **kwargs):
+        for name, value in kwargs.items():
+            setattr(self, fields.Field._apply_suffix(name), value)
+
+
+def measure(model, rows):
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    instances = [model(**row) for row in rows]
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return (after - before) / float(len(instances))
+
+
+def main(size=100000):
+    created = datetime.datetime(2020, 1, 1)
+    rows = [
+        dict(id=i, name='event', count=i, value=1.5, created=created)
+        for i in range(size)
+    ]
+
+    dict_size = measure(DictEvent, rows)
+    slot_size = measure(Event, rows)
+
+    print("instances:           %d" % size)
+    print("__dict__ per object: %.1f bytes" % dict_size)
+    print("slots per object:    %.1f bytes" % slot_size)
+    print("saved:               %.1f%%" % (100 * (1 - slot_size / dict_size)))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
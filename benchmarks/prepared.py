@@ -0,0 +1,61 @@
+"""
+Compare building a query on every call with reusing a prepared query.
+
+    python benchmarks/prepared.py [calls]
+
+Both variants run the same lookup against an in-memory database; the
+prepared query only binds a new value for the parameter on each call.
+"""
+
+import sys
+import time
+
+import sqlalchemy
+
+from mangrove import models
+from mangrove import fields
+from mangrove import connection
+
+
+class Person(models.Model):
+    name = fields.StringField()
+    age = fields.IntegerField()
+
+
+def timed(func):
+    started = time.time()
+    func()
+    return time.time() - started
+
+
+def main(calls=20000):
+    default = connection.get_connection()
+    connection.install_connection(connection.SqliteConnection())
+    try:
+        Person.save_many([
+            Person(name='person%s' % (i % 100), age=i) for i in range(1000)])
+
+        def build():
+            for i in range(calls):
+                Person.select().where(
+                    Person.name == 'person%s' % (i % 100)
+                ).order_by(Person.age).fetch(5)
+
+        prepared = Person.select().where(
+            Person.name == sqlalchemy.bindparam('name')
+        ).order_by(Person.age).limit(5).prepare()
+
+        def reuse():
+            for i in range(calls):
+                prepared.fetch(name='person%s' % (i % 100))
+
+        print("%-10s %12s" % ('variant', 'calls/s'))
+        print("%-10s %12.0f" % ('built', calls / timed(build)))
+        print("%-10s %12.0f" % ('prepared', calls / timed(reuse)))
+    finally:
+        connection.get_connection().drop_all()
+        connection.install_connection(default)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,86 @@
+"""
+Compare ingest and read throughput of the `SqliteConnection` profiles
+on a file backed database.
+
+    python benchmarks/sqlite_profiles.py [rows]
+
+Ingest is measured with one `save` per row, i.e. one transaction per
+row, and with `load_jsonl` batches. Reads are full scans of the table
+and counts filtered on an unindexed column.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+
+from mangrove import models
+from mangrove import fields
+from mangrove import connection
+
+
+class Event(models.Model):
+    name = fields.StringField()
+    count = fields.IntegerField()
+    value = fields.FloatField()
+
+
+def timed(func):
+    started = time.time()
+    func()
+    return time.time() - started
+
+
+def run(profile, rows, tmpdir):
+    path = os.path.join(tmpdir, '%s.db' % profile)
+    conn = connection.SqliteConnection(path, profile=profile)
+    connection.install_connection(conn)
+
+    saves = max(rows // 10, 1)
+
+    def save():
+        for i in range(saves):
+            Event(name='event%s' % (i % 10), count=i, value=1.5).save()
+
+    lines = ''.join(
+        json.dumps({'name': 'event%s' % (i % 10), 'count': i, 'value': 1.5})
+        + '\n' for i in range(rows))
+
+    def load():
+        Event.load_jsonl(io.StringIO(lines), batch_size=1000)
+
+    def scan():
+        for i in range(3):
+            for event in Event.select():
+                pass
+        for i in range(10):
+            Event.select().where(Event.name == 'event%s' % i).count()
+
+    result = (
+        saves / timed(save),
+        rows / timed(load),
+        timed(scan),
+    )
+    conn.drop_all()
+    return result
+
+
+def main(rows=50000):
+    tmpdir = tempfile.mkdtemp()
+    default = connection.get_connection()
+    try:
+        print("%-12s %14s %14s %10s" % (
+            'profile', 'save rows/s', 'load rows/s', 'read s'))
+        for profile in ('default', 'safe', 'balanced', 'throughput'):
+            print("%-12s %14.0f %14.0f %10.3f" % (
+                (profile,) + run(profile, rows, tmpdir)))
+    finally:
+        connection.install_connection(default)
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
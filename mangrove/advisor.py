@@ -0,0 +1,441 @@
+"""
+Query plans and index suggestions.
+
+>>> plan = Person.select().where(Person.name == 'Foobar').explain()
+>>> plan.full_scans
+['Person']
+
+>>> with advisor.Workload() as workload:
+        run_the_application()
+>>> for suggestion in advisor.suggest_indexes(workload):
+        print(suggestion.sql)
+
+>>> advisor.estimate(Person.select())  # rows according to statistics
+"""
+
+import re
+import json
+import collections
+
+import sqlalchemy
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql import operators
+
+from mangrove import connection
+
+
+# Workloads which are recording, see `Workload`
+_workloads = []
+
+EQUALITY_OPERATORS = (operators.eq, operators.in_op, operators.is_)
+RANGE_OPERATORS = (
+    operators.lt, operators.le, operators.gt, operators.ge,
+    operators.between_op, operators.like_op, operators.startswith_op,
+)
+
+
+class Explain(sqlalchemy.sql.expression.Executable,
+              sqlalchemy.sql.expression.ClauseElement):
+    """ `EXPLAIN` of a statement, compiled with the bind parameters of
+    the statement
+    """
+
+    def __init__(self, statement, prefix):
+        self.statement = statement
+        self.prefix = prefix
+
+
+@compiles(Explain)
+def _compile_explain(element, compiler, **kwargs):
+    return "%s %s" % (element.prefix,
+                      compiler.process(element.statement, **kwargs))
+
+
+class QueryPlan(object):
+    """ Plan of a query
+
+    Attributes
+    ----------
+
+    statement:
+        The SQL of the query.
+
+    rows:
+        Rows returned by the dialect's EXPLAIN as dicts.
+
+    steps:
+        Tree of steps, dicts with `detail` and `children`.
+
+    full_scans:
+        Names of the tables read without an index.
+
+    temp_sorts:
+        `True` if rows are sorted without an index.
+    """
+
+    def __init__(self, statement, rows, steps, full_scans, temp_sorts):
+        self.statement = statement
+        self.rows = rows
+        self.steps = steps
+        self.full_scans = full_scans
+        self.temp_sorts = temp_sorts
+
+    def __repr__(self):
+        return "QueryPlan(full_scans=%r, temp_sorts=%r, steps=%r)" % (
+            self.full_scans, self.temp_sorts, self.steps)
+
+
+def explain(query):
+    """ Run the dialect's EXPLAIN for `query`, see `Query.explain`
+    """
+    conn = connection.get_connection().writer()
+    dialect_name = conn.dialect_name
+    prefix = {
+        'sqlite': 'EXPLAIN QUERY PLAN',
+        'postgresql': 'EXPLAIN (FORMAT JSON)',
+        'mysql': 'EXPLAIN FORMAT=JSON',
+    }.get(dialect_name, 'EXPLAIN')
+
+    result = conn.execute(Explain(query.stmt, prefix))
+    # `result.keys()` are the columns of the explained statement
+    keys = [d[0] for d in result.cursor.description]
+    rows = [dict(zip(keys, row)) for row in result.fetchall()]
+
+    statement = str(query.stmt)
+    if dialect_name == 'sqlite':
+        return _sqlite_plan(statement, rows)
+    if dialect_name == 'postgresql':
+        return _postgresql_plan(statement, rows)
+
+    return QueryPlan(statement, rows, [], [], False)
+
+
+def _sqlite_plan(statement, rows):
+    steps = {0: {'detail': None, 'children': []}}
+    full_scans = []
+    temp_sorts = False
+
+    for row in rows:
+        step = {'detail': row['detail'], 'children': []}
+        steps[row['id']] = step
+        parent = steps.get(row['parent'], steps[0])
+        parent['children'].append(step)
+
+        # `SCAN Person` or `SCAN TABLE Person` before SQLite 3.36
+        match = re.match(r'SCAN (?:TABLE )?(\S+)', row['detail'])
+        if match and 'INDEX' not in row['detail']:
+            full_scans.append(match.group(1))
+        if row['detail'].startswith('USE TEMP B-TREE FOR ORDER BY'):
+            temp_sorts = True
+
+    return QueryPlan(statement, rows, steps[0]['children'], full_scans,
+                     temp_sorts)
+
+
+def _postgresql_plan(statement, rows):
+    plan = list(rows[0].values())[0]
+    if not isinstance(plan, list):
+        plan = json.loads(plan)
+
+    full_scans = []
+    temp_sorts = [False]
+
+    def visit(node):
+        if node.get('Node Type') == 'Seq Scan':
+            full_scans.append(node.get('Relation Name'))
+        if node.get('Node Type') == 'Sort':
+            temp_sorts[0] = True
+
+        return {
+            'detail': node.get('Node Type'),
+            'children': [visit(n) for n in node.get('Plans', [])],
+        }
+
+    steps = [visit(p['Plan']) for p in plan]
+    return QueryPlan(statement, rows, steps, full_scans, temp_sorts[0])
+
+
+def estimate(query):
+    """ Number of rows of `query` estimated from the statistics of the
+    database, `None` if the statistics do not cover the query
+
+    LIMIT and OFFSET are ignored. Estimates of queries sent to several
+    shards are added up.
+    """
+    reader = query._reader()
+
+    total = 0
+    for reader in getattr(reader, 'readers', [reader]):
+        estimate = _ESTIMATES.get(reader.dialect.name)
+        count = estimate(reader, query) if estimate is not None else None
+        if count is None:
+            return None
+        total += count
+
+    return int(total)
+
+
+def _sqlite_estimate(conn, query):
+    """ Number of rows recorded by `ANALYZE` in `sqlite_stat1`
+
+    Only covers queries without a where clause or joins.
+    """
+    if query.stmt._whereclause is not None or query._joins:
+        return None
+
+    stmt = sqlalchemy.text("SELECT stat FROM sqlite_stat1 WHERE tbl = :name")
+    try:
+        rows = conn.execute(stmt, name=query.model.get_table().name)
+        rows = rows.fetchall()
+    except sqlalchemy.exc.OperationalError:
+        # `ANALYZE` never ran, the table does not exist
+        return None
+
+    if not rows:
+        return None
+
+    # `stat` starts with the number of rows of the table, or of the
+    # index which is smaller for partial indexes
+    return max(int(row[0].split()[0]) for row in rows)
+
+
+def _postgresql_estimate(conn, query):
+    """ `pg_class.reltuples` of the table, or the planner's estimate
+    for queries with a where clause or joins
+    """
+    if query.stmt._whereclause is not None or query._joins:
+        stmt = query.stmt.limit(None).offset(None).order_by(None)
+        plan = conn.execute(
+            Explain(stmt, 'EXPLAIN (FORMAT JSON)')).scalar()
+        if not isinstance(plan, list):
+            plan = json.loads(plan)
+
+        return plan[0]['Plan']['Plan Rows']
+
+    table = query.model.get_table()
+    name = conn.dialect.identifier_preparer.format_table(table)
+    count = conn.execute(sqlalchemy.text(
+        "SELECT reltuples FROM pg_class WHERE oid = to_regclass(:name)"),
+        name=name).scalar()
+
+    # -1 if the table was never vacuumed or analyzed
+    if count is None or count < 0:
+        return None
+
+    return count
+
+
+def _mysql_estimate(conn, query):
+    """ `TABLE_ROWS` of `information_schema.TABLES`
+
+    Only covers queries without a where clause or joins.
+    """
+    if query.stmt._whereclause is not None or query._joins:
+        return None
+
+    return conn.execute(sqlalchemy.text(
+        "SELECT TABLE_ROWS FROM information_schema.TABLES "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :name"),
+        name=query.model.get_table().name).scalar()
+
+
+# Dialect name -> function estimating the rows of a query
+_ESTIMATES = {
+    'sqlite': _sqlite_estimate,
+    'postgresql': _postgresql_estimate,
+    'mysql': _mysql_estimate,
+}
+
+
+class Workload(object):
+    """ Records the shapes of the queries executed while it is active
+
+    A shape is the model with the columns compared for equality, the
+    columns compared with ranges and the columns ordered by.
+
+    .. code
+    >>> with Workload() as workload:
+            Person.select().where(Person.name == 'Foobar').fetch()
+    >>> workload.shapes
+    """
+
+    def __init__(self):
+        # shape -> [number of queries, a query of the shape]
+        self.shapes = collections.OrderedDict()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        _workloads.append(self)
+
+    def stop(self):
+        if self in _workloads:
+            _workloads.remove(self)
+
+    def record(self, query):
+        shape = query_shape(query)
+        if shape in self.shapes:
+            self.shapes[shape][0] += 1
+        else:
+            self.shapes[shape] = [1, query._clone()]
+
+
+def observe(query):
+    """ Record `query` in the active workloads
+    """
+    for workload in _workloads:
+        workload.record(query)
+
+
+def query_shape(query):
+    """ `(model, equality columns, range columns, order columns)`
+    """
+    table = query.model.get_table()
+    equality, ranges = [], []
+    _where_columns(query.stmt._whereclause, table, equality, ranges)
+
+    order = []
+    for clause in query.stmt._order_by_clause:
+        clause = getattr(clause, 'element', clause)
+        name = getattr(clause, 'name', clause)
+        if isinstance(name, str):
+            name = name.lstrip('-')
+            if name in table.columns and name not in order:
+                order.append(name)
+
+    return (query.model, tuple(equality), tuple(ranges), tuple(order))
+
+
+def _where_columns(clause, table, equality, ranges):
+    if clause is None:
+        return
+
+    if isinstance(clause, sqlalchemy.sql.elements.ClauseList):
+        for c in clause.clauses:
+            _where_columns(c, table, equality, ranges)
+        return
+
+    if isinstance(clause, sqlalchemy.sql.elements.Grouping):
+        _where_columns(clause.element, table, equality, ranges)
+        return
+
+    if not isinstance(clause, sqlalchemy.sql.elements.BinaryExpression):
+        return
+
+    name = getattr(clause.left, 'name', None)
+    if name not in table.columns:
+        return
+
+    if clause.operator in EQUALITY_OPERATORS:
+        columns = equality
+    elif clause.operator in RANGE_OPERATORS:
+        columns = ranges
+    else:
+        return
+
+    if name not in columns:
+        columns.append(name)
+
+
+class IndexSuggestion(object):
+    """ An index which would avoid full scans or sorts of a query shape
+
+    Attributes
+    ----------
+
+    model:
+        The model whose table should be indexed.
+
+    columns:
+        Names of the columns of the index, in order.
+
+    queries:
+        Number of recorded queries which would use the index.
+
+    reason:
+        What the index avoids, `full scan` or `sort`.
+
+    sql:
+        `CREATE INDEX` statement.
+
+    definition:
+        How to declare the index on the model.
+    """
+
+    def __init__(self, model, columns, queries, reason):
+        self.model = model
+        self.columns = columns
+        self.queries = queries
+        self.reason = reason
+
+    def __repr__(self):
+        return "IndexSuggestion(%s(%s), queries=%s, reason=%r)" % (
+            self.model.__name__, ', '.join(self.columns), self.queries,
+            self.reason)
+
+    @property
+    def name(self):
+        return 'ix_%s_%s' % (self.model.__name__, '_'.join(self.columns))
+
+    @property
+    def sql(self):
+        return 'CREATE INDEX %s ON "%s" (%s)' % (
+            self.name, self.model.get_table().name,
+            ', '.join('"%s"' % c for c in self.columns))
+
+    @property
+    def definition(self):
+        if len(self.columns) == 1:
+            return "%s.%s: pass `index=True` to the field" % (
+                self.model.__name__, self.columns[0])
+
+        return "%s: sqlalchemy.Index(%r, %s)" % (
+            self.model.__name__, self.name,
+            ', '.join('%s.%s' % (self.model.__name__, c)
+                      for c in self.columns))
+
+
+def suggest_indexes(workload):
+    """ Suggest indexes for the query shapes recorded by `workload`
+
+    Every shape is explained, shapes whose plan scans the model's table
+    or sorts without an index get an index on the equality columns
+    followed by the first range column or by the order columns.
+    Suggestions are ordered by the number of queries they serve.
+    """
+    suggestions = collections.OrderedDict()
+    for shape, (count, query) in workload.shapes.items():
+        model, equality, ranges, order = shape
+        plan = explain(query)
+        table_name = model.get_table().name
+
+        if table_name in plan.full_scans and (equality or ranges):
+            reason = 'full scan'
+        elif plan.temp_sorts and order:
+            reason = 'sort'
+        else:
+            continue
+
+        columns = list(equality)
+        if ranges:
+            columns.append(ranges[0])
+        else:
+            columns.extend(c for c in order if c not in columns)
+
+        key_name = model.get_key_name()
+        if not columns or columns[0] == key_name[0]:
+            continue
+
+        key = (model, tuple(columns))
+        if key in suggestions:
+            suggestions[key].queries += count
+        else:
+            suggestions[key] = IndexSuggestion(model, tuple(columns), count,
+                                               reason)
+
+    return sorted(suggestions.values(), key=lambda s: -s.queries)
@@ -0,0 +1,292 @@
+"""
+Bulk loading of rows into models and export of query results.
+
+See `models.Model.load_csv`, `models.Model.load_jsonl`,
+`query.Query.to_csv` and `query.Query.to_jsonl`.
+"""
+
+import csv
+import json
+import time
+import base64
+import decimal
+import datetime
+import contextlib
+
+from mangrove import fields
+from mangrove import connection
+from mangrove import exceptions
+
+
+class LoadReport(object):
+    """ Outcome of a bulk load
+
+    Attributes
+    ----------
+
+    rows:
+        Number of rows written.
+
+    rejected:
+        Number of rows which could not be converted.
+
+    rejects:
+        The first `MAX_REJECTS` rejected rows as
+        `(line number, row, error)` tuples.
+
+    elapsed:
+        Seconds spent loading.
+    """
+
+    MAX_REJECTS = 100
+
+    def __init__(self):
+        self.rows = 0
+        self.rejected = 0
+        self.rejects = []
+        self.elapsed = 0.0
+        self._started = time.time()
+
+    def __repr__(self):
+        return "LoadReport(rows=%s, rejected=%s, rows_per_second=%.1f)" % (
+            self.rows, self.rejected, self.rows_per_second)
+
+    @property
+    def rows_per_second(self):
+        if not self.elapsed:
+            return 0.0
+
+        return self.rows / self.elapsed
+
+    def reject(self, line, row, error):
+        self.rejected += 1
+        if len(self.rejects) < self.MAX_REJECTS:
+            self.rejects.append((line, row, error))
+
+
+def read_csv(path_or_file, **kwargs):
+    """ Yield `(line number, row dict)` from a CSV file with a header
+    """
+    with _open(path_or_file) as fp:
+        reader = csv.DictReader(fp, **kwargs)
+        for row in reader:
+            yield reader.line_num, row
+
+
+def read_jsonl(path_or_file):
+    """ Yield `(line number, row dict)` from a JSON lines file
+
+    Lines which are not JSON objects are yielded as the exception
+    raised while decoding them, they are reported as rejects.
+    """
+    with _open(path_or_file) as fp:
+        for number, line in enumerate(fp, 1):
+            if not line.strip():
+                continue
+
+            try:
+                row = json.loads(line)
+                if not isinstance(row, dict):
+                    raise ValueError("Line is not a JSON object")
+            except ValueError as e:
+                row = e
+
+            yield number, row
+
+
+def load_rows(model, rows, batch_size=1000, upsert=False, on_reject=None,
+              progress=None):
+    """ Insert `rows` into the table of `model`
+
+    :param model: The model class
+    :param rows: Iterable of `(line number, row dict)`
+    :param int batch_size: Rows per `executemany`
+    :param bool upsert: Replace rows with the same primary key
+    :param on_reject: Callable receiving `(line number, row, error)`
+        for every row which could not be converted
+    :param progress: Callable receiving the `LoadReport` after every
+        batch
+
+    Values are converted with `Field.to_python`, keys of the rows which
+    are not columns of the model are ignored. Rows are written inside
+    a transaction on every connection they are written to, only a batch
+    of rows is held in memory.
+
+    :returns: `LoadReport`
+    """
+    report = LoadReport()
+    columns = dict(
+        (column.name, column)
+        for column in model.get_columns().values()
+        if isinstance(column, fields.Field)
+    )
+    sharded = model._shard_key is not None
+    table = model.get_table()
+
+    with contextlib.ExitStack() as stack:
+        writers = {}
+        pending = {}
+        size = 0
+
+        def flush():
+            for (conn_id, names), batch in pending.items():
+                conn = writers[conn_id]
+                conn.execute(_insert(table, conn, model, upsert), batch)
+                report.rows += len(batch)
+
+            pending.clear()
+            report.elapsed = time.time() - report._started
+            if progress is not None:
+                progress(report)
+
+        for line, raw in rows:
+            try:
+                if isinstance(raw, Exception):
+                    raise raw
+
+                data = dict(
+                    (name, columns[name].to_python(value))
+                    for name, value in raw.items() if name in columns
+                )
+            except (TypeError, ValueError) as e:
+                report.reject(line, raw, e)
+                if on_reject is not None:
+                    on_reject(line, raw, e)
+                continue
+
+            writer = connection.get_connection().writer(
+                model(**data) if sharded else None)
+            if id(writer) not in writers:
+                stack.enter_context(writer.transaction())
+                writers[id(writer)] = writer
+
+            # executemany needs the same columns in every row
+            key = (id(writer), frozenset(data))
+            pending.setdefault(key, []).append(data)
+            size += 1
+
+            if size >= batch_size:
+                flush()
+                size = 0
+
+        flush()
+
+    report.elapsed = time.time() - report._started
+    return report
+
+
+def _insert(table, conn, model, upsert):
+    stmt = table.insert()
+    if not upsert:
+        return stmt
+
+    dialect_name = conn.dialect_name
+    if dialect_name == 'sqlite':
+        return stmt.prefix_with('OR REPLACE')
+
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects import postgresql
+
+        stmt = postgresql.insert(table)
+        key_name = model.get_key_name()
+        update = dict((c.name, stmt.excluded[c.name])
+                      for c in table.columns if c.name not in key_name)
+        if not update:
+            return stmt.on_conflict_do_nothing(index_elements=key_name)
+
+        return stmt.on_conflict_do_update(index_elements=key_name,
+                                          set_=update)
+
+    if dialect_name == 'mysql':
+        from sqlalchemy.dialects import mysql
+
+        stmt = mysql.insert(table)
+        update = dict((c.name, stmt.inserted[c.name]) for c in table.columns)
+        return stmt.on_duplicate_key_update(**update)
+
+    raise exceptions.NotSupportedError(
+        "Upsert is not supported for `%s`" % dialect_name)
+
+
+def dump_jsonl(result, path_or_file, chunk_size=1000):
+    """ Write the rows of `result` to a JSON lines file
+
+    Rows are fetched `chunk_size` at a time and written as JSON
+    objects keyed by column name.
+
+    :returns: Number of rows written
+    """
+    keys = list(result.keys())
+    count = 0
+    with _open(path_or_file, 'w') as fp:
+        for rows in _chunks(result, chunk_size):
+            for row in rows:
+                data = dict(zip(keys, (to_json(v) for v in row)))
+                fp.write(json.dumps(data))
+                fp.write('\n')
+            count += len(rows)
+
+    return count
+
+
+def dump_csv(result, path_or_file, chunk_size=1000, **kwargs):
+    """ Write the rows of `result` to a CSV file with a header
+
+    `kwargs` are passed to `csv.writer`.
+
+    :returns: Number of rows written
+    """
+    count = 0
+    with _open(path_or_file, 'w') as fp:
+        writer = csv.writer(fp, **kwargs)
+        writer.writerow(list(result.keys()))
+        for rows in _chunks(result, chunk_size):
+            writer.writerows([to_text(v) for v in row] for row in rows)
+            count += len(rows)
+
+    return count
+
+
+def to_json(value):
+    """ Convert a column value to a value `json.dumps` accepts
+
+    The values can be read back with `Field.to_python`.
+    """
+    if isinstance(value, (datetime.datetime, datetime.date,
+                          datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, bytes) and not isinstance(value, str):
+        return base64.b64encode(value).decode('ascii')
+
+    return value
+
+
+def to_text(value):
+    """ Convert a column value to a CSV cell
+    """
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+
+    return to_json(value)
+
+
+def _chunks(result, chunk_size):
+    while True:
+        rows = result.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield rows
+
+
+@contextlib.contextmanager
+def _open(path_or_file, mode='r'):
+    if hasattr(path_or_file, 'read') or hasattr(path_or_file, 'write'):
+        yield path_or_file
+        return
+
+    with open(path_or_file, mode, newline='') as fp:
+        yield fp
@@ -1,4 +1,16 @@
+import time
+import uuid
+import functools
+import itertools
+import threading
+import contextlib
+from concurrent import futures
+
 import sqlalchemy
+from sqlalchemy.sql import operators
+
+from mangrove import counts
+from mangrove import exceptions
 
 
 # Global connection
@@ -12,38 +24,892 @@ class Connection(object):
     """ Base class for all connections
 
     Handles metadata and engine
+
+    Set `write_behind` to a `writebehind.WriteBehind` to buffer the
+    inserts of all models written to this connection.
+
+    :param float statement_timeout: Default number of seconds after
+        which statements are cancelled, see `Query.timeout`
     """
-    def __init__(self, connection_string, **kwargs):
-        engine = sqlalchemy.create_engine(connection_string, **kwargs)
+
+    write_behind = None
+    statement_timeout = None
+
+    def __init__(self, connection_string, statement_timeout=None, **kwargs):
+        if statement_timeout is not None:
+            self.statement_timeout = statement_timeout
+
+        engine = self._create_engine(connection_string, **kwargs)
         self._engine = engine
+        self._local = threading.local()
         _metadata.reflect(engine)
         _metadata.create_all(engine)
 
-    def execute(self, statement):
+    @property
+    def dialect(self):
+        """ The SQLAlchemy dialect statements are compiled with
+        """
+        return self._engine.dialect
+
+    @property
+    def dialect_name(self):
+        """ Name of the SQLAlchemy dialect, e.g. `sqlite`
+        """
+        return self._engine.dialect.name
+
+    def _create_engine(self, connection_string, **kwargs):
+        return sqlalchemy.create_engine(connection_string, **kwargs)
+
+    def execute(self, statement, *multiparams, **params):
         """ Execute statement on this connection
+
+        Inside `transaction` the statement runs on the connection
+        holding the transaction. A list of parameter dicts executes
+        the statement with `executemany`.
+
+        Statements with a timeout, the `timeout` execution option or
+        `statement_timeout`, raise `exceptions.QueryTimeoutError` when
+        cancelled. Their rows are fetched before the timeout expires.
         """
-        return self._engine.connect().execute(statement)
+        timeout = _execution_options(statement).get('timeout')
+        if timeout is None:
+            timeout = self.statement_timeout
+
+        conn = getattr(self._local, 'connection', None)
+        written = None
+        if isinstance(statement, sqlalchemy.sql.dml.UpdateBase):
+            written = statement.table.name
+            counts.cache.invalidate(written)
+            if conn is not None:
+                # invalidated again when the transaction ends
+                self._local.written.add(written)
+                written = None
+
+        try:
+            return self._execute(
+                conn, timeout, statement, *multiparams, **params)
+        finally:
+            # a count cached while the write ran may miss it
+            if written is not None:
+                counts.cache.invalidate(written)
+
+    def _execute(self, conn, timeout, statement, *multiparams, **params):
+        if not timeout:
+            if conn is not None:
+                return conn.execute(statement, *multiparams, **params)
+
+            return self._engine.connect().execute(
+                statement, *multiparams, **params)
+
+        cancel = _TIMEOUTS.get(self.dialect_name)
+        if cancel is None:
+            raise exceptions.NotSupportedError(
+                "Statement timeouts are not supported by `%s`"
+                % self.dialect_name)
+
+        owned = conn is None
+        if owned:
+            conn = self._engine.connect()
+
+        try:
+            with cancel(conn, timeout):
+                result = conn.execute(statement, *multiparams, **params)
+                if result.returns_rows:
+                    result = _BufferedResult(result)
+        except Exception:
+            # return the DB connection to the pool, which rolls it back
+            if owned:
+                conn.close()
+            raise
+
+        if owned and isinstance(result, _BufferedResult):
+            conn.close()
+
+        return result
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """ Run the statements of the block in a single transaction
+
+        .. code
+        >>> with connection.get_connection().transaction():
+                person.save()
+                account.update()
+
+        The transaction is committed when the block exits and rolled
+        back if it raises. Nested blocks join the outer transaction.
+        """
+        if self.in_transaction():
+            yield self
+            return
+
+        conn = self._engine.connect()
+        trans = conn.begin()
+        self._local.connection = conn
+        self._local.written = set()
+        try:
+            yield self
+            trans.commit()
+        except Exception:
+            trans.rollback()
+            raise
+        finally:
+            self._local.connection = None
+            conn.close()
+
+            # counts cached by other threads before the commit are stale
+            for table_name in self._local.written:
+                counts.cache.invalidate(table_name)
+
+    def in_transaction(self):
+        """ `True` if the current thread is inside `transaction`
+        """
+        return getattr(self._local, 'connection', None) is not None
+
+    def reader(self, query=None):
+        """ Connection on which reads of `query` should be executed
+        """
+        return self
+
+    def writer(self, instance=None):
+        """ Connection on which writes of model `instance` should be
+        executed
+        """
+        return self
+
+    def route(self, name, query=None):
+        """ Connection for `name`, see `Query.using`
+        """
+        return self
+
+    def create_all(self, tables=None):
+        """ Create tables from metadata which do not exist in the DB
+        """
+        _metadata.create_all(self._engine, tables=tables)
+
+    def dispose(self):
+        """ Discard the pooled DB connections
+
+        New DB connections are opened on the next statement. Call it in
+        a forked process so it does not share DB connections with the
+        parent.
+        """
+        self._engine.dispose()
 
     def drop_all(self, *args, **kwargs):
         """ Drop all tabls from DB and metadata
         """
-        _metadata.drop_all(self._engine, *args, **kwargs)
+        self._drop_tables(*args, **kwargs)
         _metadata.clear()
+        counts.cache.clear()
+
+    def _drop_tables(self, *args, **kwargs):
+        _metadata.drop_all(self._engine, *args, **kwargs)
 
 
 class SqliteConnection(Connection):
     """ Create connection to Sqlite DB
+
+    :param str dbpath: Path of the database file, `:memory:` for an in
+        memory database
+    :param str profile: Name of a profile in `PROFILES`, its pragmas
+        are set on every new DB connection
+    :param dict pragmas: Pragmas set after the ones of the profile,
+        e.g. `{'cache_size': -100000}`
+    :param bool shared: Use a shared cache in memory database which
+        every thread and DB connection of this connection sees. By
+        default every thread gets its own in memory database.
+
+    Profiles
+    --------
+
+    safe:
+        WAL journal, full fsync on commit.
+
+    balanced:
+        WAL journal, fsync on checkpoints only, larger page cache and
+        temporary tables in memory.
+
+    throughput:
+        As `balanced` without fsync and with memory mapped I/O. A
+        power loss can lose the latest transactions.
+
+    With a profile or pragmas DB connections to a database file are
+    pooled, as are the DB connections of a `shared` database. The profiles wait up to `busy_timeout` milliseconds for
+    locks.
+    Threads writing to a `shared` database can still fail with
+    "database table is locked", shared cache locks are not retried.
     """
-    def __init__(self, dbpath=":memory:", **kwargs):
+
+    PROFILES = {
+        'default': (),
+        'safe': (
+            ('journal_mode', 'WAL'),
+            ('synchronous', 'FULL'),
+            ('busy_timeout', 5000),
+        ),
+        'balanced': (
+            ('journal_mode', 'WAL'),
+            ('synchronous', 'NORMAL'),
+            ('cache_size', -16000),
+            ('temp_store', 'MEMORY'),
+            ('busy_timeout', 5000),
+        ),
+        'throughput': (
+            ('journal_mode', 'WAL'),
+            ('synchronous', 'OFF'),
+            ('cache_size', -64000),
+            ('mmap_size', 268435456),
+            ('temp_store', 'MEMORY'),
+            ('busy_timeout', 5000),
+        ),
+    }
+
+    def __init__(self, dbpath=":memory:", profile=None, pragmas=None,
+                 shared=False, **kwargs):
+        if profile is not None and profile not in self.PROFILES:
+            raise ValueError("Unknown SQLite profile `%s`" % profile)
+
+        self.pragmas = list(self.PROFILES[profile or 'default'])
+        self.pragmas.extend(sorted((pragmas or {}).items()))
+        self.shared = shared
+        self._keeper = None
+
+        if shared:
+            if dbpath != ":memory:":
+                raise ValueError("Only in memory databases can be shared")
+
+            # the database lives as long as one DB connection is open
+            dbpath = "file:mangrove_%s?mode=memory&cache=shared&uri=true" \
+                % uuid.uuid4().hex
+
+        if (shared or self.pragmas) and dbpath != ":memory:" and \
+                'poolclass' not in kwargs:
+            # keep DB connections open so pragmas are set and shared
+            # databases are opened once per DB connection, not once per
+            # statement
+            kwargs['poolclass'] = sqlalchemy.pool.QueuePool
+            kwargs.setdefault('max_overflow', -1)
+            connect_args = kwargs.setdefault('connect_args', {})
+            connect_args.setdefault('check_same_thread', False)
+
         connection_string = "sqlite:///%s" % dbpath
         super(SqliteConnection, self).__init__(connection_string, **kwargs)
 
+    def _create_engine(self, connection_string, **kwargs):
+        engine = super(SqliteConnection, self)._create_engine(
+            connection_string, **kwargs)
+        sqlalchemy.event.listen(engine, 'connect', self._set_pragmas)
+
+        if self.shared:
+            self._keeper = engine.raw_connection()
+
+        return engine
+
+    def _set_pragmas(self, dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in self.pragmas:
+                cursor.execute("PRAGMA %s = %s" % (name, value))
+        finally:
+            cursor.close()
+
+
+class RoutingConnection(Connection):
+    """ Routes reads to replicas and writes to the primary
+
+    .. code
+    >>> primary = SqliteConnection('primary.db')
+    >>> replicas = [SqliteConnection('replica%s.db' % i) for i in range(2)]
+    >>> install_connection(RoutingConnection(primary, replicas))
+
+    `Query` reads and `count` go to a replica, `save`, `update` and
+    `delete` go to the primary. While the current thread is inside
+    `transaction` reads go to the primary as well. Use
+    `Query.using('primary')` to read from the primary explicitly.
+
+    :param Connection primary: Connection receiving the writes
+    :param list replicas: Connections receiving the reads
+    :param str policy: `round_robin` or `least_loaded`, the replica
+        with the fewest reads in progress, ties are broken round robin
+    :param health_check: Callable receiving a replica and returning
+        `False` if the replica should not receive reads
+    :param lag_check: Callable receiving a replica and returning its
+        replication lag in seconds
+    :param float max_lag: Replicas lagging more than `max_lag` seconds
+        do not receive reads
+    :param float check_interval: Seconds for which results of
+        `health_check` and `lag_check` are cached
+
+    If no replica is usable reads fall back to the primary.
+    """
+
+    POLICIES = ('round_robin', 'least_loaded')
+
+    def __init__(self, primary, replicas=(), policy='round_robin',
+                 health_check=None, lag_check=None, max_lag=None,
+                 check_interval=1.0):
+        if policy not in self.POLICIES:
+            raise ValueError("Unknown routing policy `%s`" % policy)
+
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.policy = policy
+        self.health_check = health_check
+        self.lag_check = lag_check
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        self._cycle = itertools.cycle(range(len(self.replicas)))
+        self._load = [0] * len(self.replicas)
+        self._status = {}
+
+    def execute(self, statement, *multiparams, **params):
+        return self.writer().execute(statement, *multiparams, **params)
+
+    @property
+    def dialect(self):
+        return self.primary.dialect
+
+    @property
+    def dialect_name(self):
+        return self.primary.dialect_name
+
+    def transaction(self):
+        return self.primary.transaction()
+
+    def in_transaction(self):
+        return self.primary.in_transaction()
+
+    def reader(self, query=None):
+        if not self.replicas or self.in_transaction():
+            return self.primary
+
+        with self._lock:
+            candidates = [i for i in range(len(self.replicas))
+                          if self._is_usable(i)]
+            if not candidates:
+                return self.primary
+
+            if self.policy == 'least_loaded':
+                # replicas equally loaded, e.g. idle, take turns
+                lowest = min(self._load[i] for i in candidates)
+                candidates = [i for i in candidates
+                              if self._load[i] == lowest]
+
+            index = next(self._cycle)
+            while index not in candidates:
+                index = next(self._cycle)
+
+        return _ReplicaConnection(self, index)
+
+    def writer(self, instance=None):
+        return self.primary
+
+    def route(self, name, query=None):
+        if name == 'primary':
+            return self.writer()
+        if name == 'replica':
+            return self.reader(query)
+
+        raise ValueError("Unknown route `%s`" % name)
+
+    def create_all(self, tables=None):
+        for conn in [self.primary] + self.replicas:
+            conn.create_all(tables=tables)
+
+    def dispose(self):
+        for conn in [self.primary] + self.replicas:
+            conn.dispose()
+
+    def _drop_tables(self, *args, **kwargs):
+        for conn in [self.primary] + self.replicas:
+            conn._drop_tables(*args, **kwargs)
+
+    def _is_usable(self, index):
+        """ Run the health and lag hooks for replica at `index`
+
+        Must be called with `_lock` held.
+        """
+        if self.health_check is None and self.lag_check is None:
+            return True
+
+        now = time.time()
+        checked_at, usable = self._status.get(index, (None, True))
+        if checked_at is not None and now - checked_at < self.check_interval:
+            return usable
+
+        replica = self.replicas[index]
+        try:
+            usable = True
+            if self.health_check is not None:
+                usable = bool(self.health_check(replica))
+            if usable and self.lag_check is not None:
+                lag = self.lag_check(replica)
+                usable = self.max_lag is None or lag <= self.max_lag
+        except Exception:
+            usable = False
+
+        self._status[index] = (now, usable)
+        return usable
+
+
+class _ReplicaConnection(object):
+    """ Replica chosen by `RoutingConnection.reader`
+
+    Keeps track of the statements running on the replica for the
+    `least_loaded` policy.
+    """
+
+    def __init__(self, router, index):
+        self.router = router
+        self.index = index
+        self.connection = router.replicas[index]
+
+    @property
+    def dialect(self):
+        return self.connection.dialect
+
+    def execute(self, statement, *multiparams, **params):
+        router = self.router
+        with router._lock:
+            router._load[self.index] += 1
+        try:
+            return self.connection.execute(statement, *multiparams, **params)
+        finally:
+            with router._lock:
+                router._load[self.index] -= 1
+
+    def transaction(self):
+        return self.connection.transaction()
+
+
+class ShardedConnection(Connection):
+    """ Spreads the rows of sharded models over several connections
+
+    .. code
+    >>> shards = [SqliteConnection('shard%s.db' % i) for i in range(4)]
+    >>> install_connection(ShardedConnection(shards))
+
+    >>> class Event(Model):
+            user_id = IntegerField(primary_key=True)
+            name = StringField()
+
+            shard_key = 'user_id'
+
+    `save`, `update` and `delete` are sent to the shard chosen by
+    `Model.get_shard` for the value of the shard key. Queries are sent
+    to every shard in parallel and the results are merged, respecting
+    `order_by`, `limit`, `offset` and `count`. If the where clause
+    pins the shard key with `==` or `in_` only those shards are
+    queried. Models without a `shard_key` live on the first shard.
+
+    Shards can be any connection, e.g. `RoutingConnection`. Shards
+    must be usable from several threads, file backed SQLite databases
+    are. Use `parallel=False` for in memory SQLite databases.
+
+    There are no cross shard transactions, use
+    `shards[index].transaction()` for a transaction on one shard.
+    """
+
+    def __init__(self, shards, parallel=True, max_workers=None):
+        if not shards:
+            raise ValueError("At least one shard is required")
+
+        self.shards = list(shards)
+        self.parallel = parallel
+        self.max_workers = max_workers or len(self.shards)
+
+    def execute(self, statement, *multiparams, **params):
+        return self.writer().execute(statement, *multiparams, **params)
+
+    @property
+    def dialect(self):
+        return self.shards[0].dialect
+
+    @property
+    def dialect_name(self):
+        return self.shards[0].dialect_name
+
+    def transaction(self):
+        raise exceptions.NotSupportedError(
+            "Cross shard transactions are not supported, use "
+            "`shards[index].transaction()`")
+
+    def in_transaction(self):
+        return any(shard.in_transaction() for shard in self.shards)
+
+    def reader(self, query=None):
+        if query is None:
+            return self.shards[0].reader()
+
+        indexes = self.shard_indexes(query)
+        if len(indexes) == 1:
+            return self.shards[indexes[0]].reader(query)
+
+        readers = [self.shards[i].reader(query) for i in indexes]
+        return _ShardedReader(self, readers)
+
+    def writer(self, instance=None):
+        if instance is None or instance._shard_key is None:
+            return self.shards[0].writer(instance)
+
+        value = getattr(instance, instance._shard_key)
+        if value is None:
+            detail = "Shard key `%s` of `%s` is not set" % (
+                instance._shard_key, instance.__class__.__name__)
+            raise ValueError(detail)
+
+        index = instance.get_shard(value, len(self.shards))
+        return self.shards[index].writer(instance)
+
+    def route(self, name, query=None):
+        if name not in ('primary', 'replica'):
+            raise ValueError("Unknown route `%s`" % name)
+
+        if query is None:
+            return self.shards[0].route(name)
+
+        indexes = self.shard_indexes(query)
+        readers = [self.shards[i].route(name, query) for i in indexes]
+        if len(readers) == 1:
+            return readers[0]
+
+        return _ShardedReader(self, readers)
+
+    def shard_indexes(self, query):
+        """ Indexes of the shards which have to be queried for `query`
+
+        Statements which are not a query of a sharded model, e.g. a
+        `SelectStatement` built from a raw select, go to the first
+        shard.
+        """
+        model = getattr(query, 'model', None)
+        if model is None or model._shard_key is None:
+            return [0]
+
+        column = getattr(model, model._shard_key).name
+        values = _pinned_values(query.stmt._whereclause, column)
+        if values is None:
+            return list(range(len(self.shards)))
+
+        num_shards = len(self.shards)
+        return sorted(set(model.get_shard(v, num_shards) for v in values))
+
+    def create_all(self, tables=None):
+        for shard in self.shards:
+            shard.create_all(tables=tables)
+
+    def dispose(self):
+        for shard in self.shards:
+            shard.dispose()
+
+    def _drop_tables(self, *args, **kwargs):
+        for shard in self.shards:
+            shard._drop_tables(*args, **kwargs)
+
+
+class _ShardedReader(object):
+    """ Executes a select statement on several shards and merges rows
+    """
+
+    def __init__(self, sharded, readers):
+        self.sharded = sharded
+        self.readers = readers
+
+    def execute(self, statement, *multiparams, **params):
+        # the offset is applied once, after merging, and every shard may
+        # hold all of the rows up to the end of the final page
+        limit, offset = statement._limit, statement._offset
+        shard_stmt = statement.offset(None)
+        if limit is not None:
+            shard_stmt = shard_stmt.limit(limit + (offset or 0))
+
+        def fetch(reader):
+            return reader.execute(
+                shard_stmt, *multiparams, **params).fetchall()
+
+        if self.sharded.parallel:
+            max_workers = min(self.sharded.max_workers, len(self.readers))
+            with futures.ThreadPoolExecutor(max_workers) as executor:
+                results = list(executor.map(fetch, self.readers))
+        else:
+            results = [fetch(reader) for reader in self.readers]
+
+        return _MergedResult(statement, results)
+
+
+class _MergedResult(object):
+    """ Result of a select statement executed on several shards
+
+    Rows are ordered by the `order_by` clause of the statement and
+    `limit` and `offset` are applied after merging. `scalar` adds up
+    the scalars of the shards, it is meant for `count` and `exists`.
+    """
+
+    def __init__(self, statement, results):
+        self._keys = [c.key for c in statement.inner_columns]
+        self._position = 0
+        self._scalars = [rows[0][0] for rows in results if rows]
+
+        rows = [row for shard_rows in results for row in shard_rows]
+        order = _order_keys(statement)
+        if order:
+            rows.sort(key=functools.cmp_to_key(_row_comparator(order)))
+
+        offset = statement._offset or 0
+        limit = statement._limit
+        stop = None if limit is None else offset + limit
+        self._rows = rows[offset:stop]
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def keys(self):
+        return self._keys
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def fetchmany(self, size):
+        rows = self._rows[self._position:self._position + size]
+        self._position += len(rows)
+        return rows
+
+    def first(self):
+        return self._rows[0] if self._rows else None
+
+    def scalar(self):
+        return sum(self._scalars)
+
+
+class _BufferedResult(object):
+    """ Rows of a statement fetched while its timeout was running
+    """
+
+    returns_rows = True
+
+    def __init__(self, result):
+        self._keys = result.keys()
+        self._rows = result.fetchall()
+        self._position = 0
+        # closed, `cursor.description` is still available
+        self.cursor = result.cursor
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def keys(self):
+        return self._keys
+
+    def fetchall(self):
+        rows = self._rows[self._position:]
+        self._position = len(self._rows)
+        return rows
+
+    def fetchmany(self, size):
+        rows = self._rows[self._position:self._position + size]
+        self._position += len(rows)
+        return rows
+
+    def first(self):
+        return self._rows[0] if self._rows else None
+
+    def scalar(self):
+        return self._rows[0][0] if self._rows else None
+
+
+def _execution_options(statement):
+    """ Execution options of a statement, compiled or not
+    """
+    if isinstance(statement, sqlalchemy.sql.compiler.Compiled):
+        return statement.execution_options
+
+    return getattr(statement, '_execution_options', {})
+
+
+def _timeout_error(seconds):
+    return exceptions.QueryTimeoutError(
+        "Statement cancelled after %s seconds" % seconds)
+
+
+@contextlib.contextmanager
+def _sqlite_timeout(conn, seconds):
+    """ Interrupt the statements running on `conn` after `seconds`
+
+    The progress handler of the DB connection is called every 1000
+    virtual machine instructions, returning `True` interrupts the
+    statement.
+    """
+    dbapi_connection = conn.connection.connection
+    deadline = time.time() + seconds
+    expired = []
+
+    def progress():
+        if time.time() < deadline:
+            return False
+
+        expired.append(True)
+        return True
+
+    dbapi_connection.set_progress_handler(progress, 1000)
+    try:
+        yield
+    except sqlalchemy.exc.OperationalError:
+        if not expired:
+            raise
+        raise _timeout_error(seconds)
+    finally:
+        dbapi_connection.set_progress_handler(None, 0)
+
+
+@contextlib.contextmanager
+def _postgresql_timeout(conn, seconds):
+    """ Set `statement_timeout` for the current transaction
+
+    The previous value is restored afterwards. A cancelled statement
+    aborts the transaction, rolling it back restores the value.
+    """
+    previous = conn.execute(sqlalchemy.text(
+        "SELECT current_setting('statement_timeout')")).scalar()
+    set_config = sqlalchemy.text(
+        "SELECT set_config('statement_timeout', :value, true)")
+
+    conn.execute(set_config, value='%dms' % max(seconds * 1000, 1))
+    try:
+        yield
+    except sqlalchemy.exc.DBAPIError as error:
+        if getattr(error.orig, 'pgcode', None) != '57014':
+            raise
+        raise _timeout_error(seconds)
+
+    conn.execute(set_config, value=previous)
+
+
+@contextlib.contextmanager
+def _mysql_timeout(conn, seconds):
+    """ Set `max_execution_time` of the session, it only applies to
+    SELECT statements
+    """
+    previous = conn.execute(sqlalchemy.text(
+        "SELECT @@SESSION.max_execution_time")).scalar()
+    set_timeout = sqlalchemy.text(
+        "SET SESSION max_execution_time = :value")
+
+    conn.execute(set_timeout, value=max(int(seconds * 1000), 1))
+    try:
+        yield
+    except sqlalchemy.exc.DBAPIError as error:
+        if not error.orig.args or error.orig.args[0] != 3024:
+            raise
+        raise _timeout_error(seconds)
+    finally:
+        if not conn.invalidated:
+            conn.execute(set_timeout, value=previous)
+
+
+# Dialect name -> context manager cancelling statements after a timeout
+_TIMEOUTS = {
+    'sqlite': _sqlite_timeout,
+    'postgresql': _postgresql_timeout,
+    'mysql': _mysql_timeout,
+}
+
+
+def _pinned_values(clause, column_name):
+    """ Values to which `clause` restricts column `column_name`
+
+    Returns `None` if the clause does not restrict the column to a
+    finite set of values.
+    """
+    if clause is None:
+        return None
+
+    operator = getattr(clause, 'operator', None)
+    if isinstance(clause, sqlalchemy.sql.elements.BooleanClauseList):
+        sets = [_pinned_values(c, column_name) for c in clause.clauses]
+        if operator is operators.and_:
+            sets = [s for s in sets if s is not None]
+            return set.intersection(*sets) if sets else None
+        if operator is operators.or_ and None not in sets:
+            return set.union(*sets)
+        return None
+
+    if isinstance(clause, sqlalchemy.sql.elements.Grouping):
+        return _pinned_values(clause.element, column_name)
+
+    if not isinstance(clause, sqlalchemy.sql.elements.BinaryExpression):
+        return None
+
+    left, right = clause.left, clause.right
+    if getattr(left, 'name', None) != column_name:
+        return None
+
+    # `bindparam('name')` placeholders have no value, they pin nothing
+    def bound(bind):
+        return isinstance(bind, sqlalchemy.sql.elements.BindParameter) and \
+            (bind.value is not None or bind.callable is not None)
+
+    if operator is operators.eq and bound(right):
+        return set([right.effective_value])
+
+    if operator is operators.in_op:
+        right = getattr(right, 'element', right)
+        binds = getattr(right, 'clauses', [])
+        if binds and all(bound(b) for b in binds):
+            return set(b.effective_value for b in binds)
+
+    return None
+
+
+def _order_keys(statement):
+    """ List of (column name, descending) from the `order_by` clause
+    """
+    keys = []
+    for clause in statement._order_by_clause:
+        descending = False
+        if isinstance(clause, sqlalchemy.sql.elements.UnaryExpression):
+            # `-Person.age` is compiled to `-age`, i.e. descending order
+            descending = clause.modifier is operators.desc_op or \
+                clause.operator is operators.neg
+            clause = clause.element
+
+        name = getattr(clause, 'name', None)
+        if name is None:
+            name = getattr(clause, 'element', None)
+        if not isinstance(name, str):
+            raise ValueError("Cannot merge shards ordered by `%s`" % clause)
+
+        if name.startswith('-'):
+            name, descending = name[1:], True
+
+        keys.append((name, descending))
+
+    return keys
+
+
+def _row_comparator(order):
+    def compare(row1, row2):
+        for name, descending in order:
+            # NULL is smaller than any value, as in SQLite
+            value1 = (row1[name] is not None, row1[name])
+            value2 = (row2[name] is not None, row2[name])
+            if value1 != value2:
+                result = -1 if value1 < value2 else 1
+                return -result if descending else result
+
+        return 0
+
+    return compare
+
 
 def install_connection(connection):
     """ Install as default connection
     """
     global _connection
     _connection = connection
+    counts.cache.clear()
 
 
 def add_model(model_cls):
@@ -71,7 +937,7 @@ def add_model(model_cls):
             raise # re-raise the exception
         else:
             if _connection is not None:
-                _metadata.create_all(_connection._engine, tables=[table])
+                _connection.create_all(tables=[table])
 
 
 def get_table(model_cls):
@@ -0,0 +1,96 @@
+"""
+Cache of exact counts, see `Query.count`.
+
+>>> Person.select().where(Person.age > 30).count(cache=True)
+"""
+
+import threading
+import collections
+
+from sqlalchemy.sql import util as sql_util
+
+
+class CountCache(object):
+    """ Exact counts by count statement and connection
+
+    Every table has a version which is bumped by the inserts, updates
+    and deletes mangrove executes on it. A cached count is used as long
+    as the versions of the tables of its statement did not change, so
+    writes made while a count runs are never missed. Writes made
+    outside of mangrove are not seen.
+
+    :param int max_size: Number of counts kept, the least recently used
+        are evicted first
+    """
+
+    def __init__(self, max_size=1000):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._versions = collections.defaultdict(int)
+        self._counts = collections.OrderedDict()
+
+    def count(self, statement, execute, reader=None):
+        """ Cached count of `statement` read from `reader`, `execute()`
+        counts on a miss
+        """
+        key = _statement_key(statement)
+        if key is None:
+            return execute()
+
+        # replicas may lag and shards hold different rows
+        key = (_reader_key(reader),) + key
+
+        tables = sorted(set(t.name for t in sql_util.find_tables(statement)))
+        with self._lock:
+            versions = tuple(self._versions[t] for t in tables)
+            entry = self._counts.pop(key, None)
+            if entry is not None and entry[0] == versions:
+                self._counts[key] = entry
+                return entry[1]
+
+        count = execute()
+        with self._lock:
+            self._counts[key] = (versions, count)
+            while len(self._counts) > self.max_size:
+                self._counts.popitem(last=False)
+
+        return count
+
+    def invalidate(self, table_name):
+        """ Discard the counts reading table `table_name`
+        """
+        with self._lock:
+            self._versions[table_name] += 1
+
+    def clear(self):
+        with self._lock:
+            self._versions.clear()
+            self._counts.clear()
+
+
+cache = CountCache()
+
+
+def _reader_key(reader):
+    """ Identity of the connections behind `reader`, e.g. the replica
+    picked by a `RoutingConnection` or the shards of a fan-out
+    """
+    readers = getattr(reader, 'readers', None)
+    if readers is not None:
+        return tuple(_reader_key(r) for r in readers)
+
+    return id(getattr(reader, 'connection', reader))
+
+
+def _statement_key(statement):
+    """ SQL and bind parameter values of `statement`, `None` if the
+    values are not hashable
+    """
+    compiled = statement.compile()
+    params = tuple(sorted(compiled.params.items()))
+    try:
+        hash(params)
+    except TypeError:
+        return None
+
+    return str(compiled), params
@@ -1,2 +1,14 @@
 class InvalidKeyFieldError(Exception):
     pass
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class NotSupportedError(Exception):
+    pass
+
+
+class QueryTimeoutError(Exception):
+    pass
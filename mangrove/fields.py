@@ -1,20 +1,90 @@
 import sys
+import datetime
 import sqlalchemy
 
 
+PY2 = sys.version_info < (3, 0)
+
+# Validation modes, see `set_validation_mode`
+STRICT = 'strict'
+OFF = 'off'
+DEFERRED = 'deferred'
+VALIDATION_MODES = (STRICT, OFF, DEFERRED)
+
+_validation_mode = STRICT
+
+
+def set_validation_mode(mode):
+    """ Set how values assigned to fields are type checked
+
+    strict:
+        Every assignment is checked, `ValueError` is raised for values
+        of the wrong type.
+
+    off:
+        Values are not checked.
+
+    deferred:
+        Assignments are not checked, `Model.save`, `Model.save_many`
+        and `Model.update` check all the fields of the instances before
+        writing.
+
+    Models can override the mode with their `validation` attribute.
+    """
+    global _validation_mode
+    if mode not in VALIDATION_MODES:
+        raise ValueError("Unknown validation mode `%s`" % mode)
+
+    _validation_mode = mode
+
+
+def get_validation_mode():
+    return _validation_mode
+
+
 class Field(sqlalchemy.Column):
     """ Base class for all field types
+
+    :param bool deferred: If `True` the column is not selected by
+        queries, it is loaded on first access. See `Query.defer`.
     """
+    def __init__(self, *args, **kwargs):
+        self.deferred = kwargs.pop('deferred', False)
+        super(Field, self).__init__(*args, **kwargs)
+
+        try:
+            self._python_type = self.type.python_type
+        except NotImplementedError:
+            self._python_type = None
+
     def __get__(self, obj, obj_type):
         if obj is None:
             return self
 
-        return getattr(obj, self._apply_suffix(self.name), self.default)
+        name = self._apply_suffix(self.name)
+        try:
+            return getattr(obj, name)
+        except AttributeError:
+            pass
+
+        deferred = obj._deferred
+        if deferred and self.name in deferred:
+            obj._deferred_loader.load(self.name)
+
+        return getattr(obj, name, self.default)
 
     def __set__(self, obj, value):
-        self._check_type(self, value)
+        python_type = self._python_type
+        if value is not None and python_type is not None and \
+                not isinstance(value, python_type) and \
+                (obj._validation_mode or _validation_mode) == STRICT:
+            self._check_type(self, value)
         setattr(obj, self._apply_suffix(self.name), value)
 
+        deferred = obj._deferred
+        if deferred:
+            deferred.discard(self.name)
+
     def __repr__(self):
         return self._repr()
 
@@ -33,6 +103,8 @@ class Field(sqlalchemy.Column):
             kwargs.append('default')
         if self.server_default:
             kwargs.append('server_default')
+        if self.deferred:
+            kwargs.append('deferred')
 
         kwargs = {k: repr(getattr(self, k)) for k in kwargs}
         kwargs.update({k: repr(v) for k, v in extra_kw.items()})
@@ -42,9 +114,15 @@ class Field(sqlalchemy.Column):
         cls_name = self.__class__.__name__
         return "%s(%s)" % (cls_name, ', '.join(args))
 
+    def get_python_type(self):
+        """ Python type of the values of the field, `None` if unknown
+        """
+        return self._python_type
+
     def _check_type(self, obj, value):
-        python_type = obj.type.python_type
-        if value is not None and not isinstance(value, python_type):
+        python_type = obj.get_python_type()
+        if value is not None and python_type is not None and \
+                not isinstance(value, python_type):
             name = self.name
             detail = (
                 "`%s` should be of type `%s`, " % (name, python_type.__name__),
@@ -53,6 +131,21 @@ class Field(sqlalchemy.Column):
             detail = ''.join(detail)
             raise ValueError(detail)
 
+    def to_python(self, value):
+        """ Convert `value` read from a text source, e.g. a CSV cell or
+        a JSON value, to the type of the field
+
+        Empty strings are converted to `None`. Raises `ValueError` if
+        the value cannot be converted.
+        """
+        python_type = self.get_python_type()
+        if value is None or isinstance(value, python_type):
+            return value
+        if value == '':
+            return None
+
+        return python_type(value)
+
     @staticmethod
     def _apply_suffix(raw_str):
         return "_prop__%s" % raw_str
@@ -95,17 +188,23 @@ class StringField(Field):
 
         return self._repr(**kwargs)
 
-    def __set__(self, obj, value):
-        """Sanitize `value` for Python 2
+    if PY2:
+        def __set__(self, obj, value):
+            """Sanitize `value` for Python 2
 
-        In Python 2 `str` and `unicode` are different, sqlalchemy reads data
-        `str` as `unicode` from the DB which fails check.
-        """
-        if sys.version_info < (3, 0):
+            In Python 2 `str` and `unicode` are different, sqlalchemy reads
+            data `str` as `unicode` from the DB which fails check.
+            """
             if isinstance(value, unicode):
                 value = str(value)
 
-        super(StringField, self).__set__(obj, value)
+            super(StringField, self).__set__(obj, value)
+
+    def to_python(self, value):
+        if value is None:
+            return value
+
+        return str(value)
 
 
 class IntegerField(Field):
@@ -130,6 +229,25 @@ class BooleanField(Field):
         kwargs['type_'] = sqlalchemy.Boolean
         super(BooleanField, self).__init__(**kwargs)
 
+    TRUE = ('1', 'true', 't', 'yes', 'y')
+    FALSE = ('0', 'false', 'f', 'no', 'n')
+
+    def to_python(self, value):
+        if value is None or isinstance(value, bool):
+            return value
+        if value == '':
+            return None
+        if value in (0, 1):
+            return bool(value)
+
+        lower = str(value).strip().lower()
+        if lower in self.TRUE:
+            return True
+        if lower in self.FALSE:
+            return False
+
+        raise ValueError("`%s` is not a valid boolean" % value)
+
 
 class FloatField(Field):
     """
@@ -152,6 +270,28 @@ class DateTimeField(Field):
         kwargs['type_'] = sqlalchemy.DateTime
         super(DateTimeField, self).__init__(**kwargs)
 
+    FORMATS = (
+        '%Y-%m-%d %H:%M:%S.%f',
+        '%Y-%m-%d %H:%M:%S',
+        '%Y-%m-%dT%H:%M:%S.%f',
+        '%Y-%m-%dT%H:%M:%S',
+        '%Y-%m-%d',
+    )
+
+    def to_python(self, value):
+        if value is None or isinstance(value, datetime.datetime):
+            return value
+        if value == '':
+            return None
+
+        for fmt in self.FORMATS:
+            try:
+                return datetime.datetime.strptime(value, fmt)
+            except (TypeError, ValueError):
+                pass
+
+        raise ValueError("`%s` is not a valid datetime" % value)
+
 
 class ReferenceField(sqlalchemy.ForeignKeyConstraint):
     """
@@ -173,10 +313,17 @@ class ReferenceField(sqlalchemy.ForeignKeyConstraint):
 
         `print(child.parent.name)` should output 'parent'
 
+    The referenced model gets a reverse accessor returning a query over
+    the referencing rows, named `<model>_set` unless `related_name` is
+    given:
+
+        >>> parent.child_set.fetch()
+
     See sqlalchemy.ForeignKeyConstraint for further documentation.
     """
 
     def __init__(self, reference, *args, **kwargs):
+        self.related_name = kwargs.pop('related_name', None)
         self.reference = reference
         ref_name = reference.__name__
         ref_fk_columns = reference.get_key_name()
@@ -232,3 +379,103 @@ class ReferenceField(sqlalchemy.ForeignKeyConstraint):
     @staticmethod
     def apply_prefix(*args):
         return "fk_%s" % '_'.join(args)
+
+
+class ReverseReference(object):
+    """
+    Reverse accessor of a `ReferenceField`, added to the referenced
+    model.
+
+    >>> class Child(Model):
+            parent = ReferenceField(Parent)
+
+    >>> parent.child_set.count()
+    >>> parent.child_set.order_by(Child.name).fetch()
+
+    The accessor returns a `Query` over the children of the instance,
+    which is empty while the instance has no key.
+    Use `Query.prefetch_related('child_set')` to load the children of
+    every parent returned by a query with one statement per batch, and
+    `Parent.child_set.counts(parents)` to count the children of several
+    parents at once.
+    """
+
+    def __init__(self, model, field):
+        self.model = model
+        self.field = field
+
+    def __get__(self, obj, obj_type):
+        if obj is None:
+            return self
+
+        query = self.model.select()
+        key = self._key(obj)
+        if None in key:
+            # `fk IS NULL` would match the children without a parent
+            query.where(sqlalchemy.false())
+        else:
+            for column, value in zip(self._columns(), key):
+                query.where(column == value)
+
+        prefetched = getattr(obj, '_prefetched', None) or {}
+        if self.name in prefetched:
+            query._result_cache = (query.stmt, prefetched[self.name])
+
+        return query
+
+    @property
+    def name(self):
+        return (self.field.related_name or
+                '%s_set' % self.model.__name__.lower())
+
+    def prefetch(self, instances):
+        """ Load the children of `instances` with one `IN` query
+        """
+        groups = {}
+        for instance in instances:
+            groups.setdefault(self._key(instance), [])
+
+        query = self.model.select().where(self._in(list(groups)))
+        fk_columns = list(self.field.get_fk_columns().keys())
+        for child in query:
+            key = tuple(getattr(child, c) for c in fk_columns)
+            groups[key].append(child)
+
+        for instance in instances:
+            if getattr(instance, '_prefetched', None) is None:
+                instance._prefetched = {}
+            instance._prefetched[self.name] = groups[self._key(instance)]
+
+    def counts(self, instances):
+        """ Number of children of each instance, keyed by instance key
+        """
+        counts = dict((self._key(i), 0) for i in instances)
+        if not counts:
+            return counts
+
+        columns = self._columns()
+        query = self.model.select(
+            columns=columns + [sqlalchemy.func.count()])
+        query.where(self._in(list(counts)))
+        query.stmt = query.stmt.group_by(*columns)
+
+        for row in query.execute():
+            # rows of the same group may come from several shards
+            counts[tuple(row)[:-1]] += row[-1]
+
+        return counts
+
+    def _columns(self):
+        table = self.model.get_table()
+        return [table.columns[c] for c in self.field.get_fk_columns()]
+
+    def _key(self, instance):
+        return tuple(getattr(instance, k)
+                     for k in self.field.reference.get_key_name())
+
+    def _in(self, keys):
+        columns = self._columns()
+        if len(columns) == 1:
+            return columns[0].in_([k[0] for k in keys])
+
+        return sqlalchemy.tuple_(*columns).in_(keys)
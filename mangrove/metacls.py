@@ -8,8 +8,21 @@ class MetaCls(type):
 
     The meta class is used to assign names to the fields of the model
     """
+
+    # Model options and the private attributes they are resolved to, a
+    # field can have the name of an option
+    OPTIONS = (
+        ('shard_key', '_shard_key'),
+        ('shard_function', '_shard_function'),
+        ('write_behind', '_write_behind'),
+        ('validation', '_validation_mode'),
+    )
+
     def __new__(metacls, name, bases, namespace, **kwargs):
+        namespace = dict(namespace)
+        namespace['__slots__'] = metacls.get_slots(bases, namespace)
         cls = type.__new__(metacls, name, bases, namespace, **kwargs)
+        metacls.resolve_options(cls, namespace)
 
         if cls.abstract:
             return cls
@@ -27,11 +40,25 @@ class MetaCls(type):
 
         # Add foreign key columns to the model
         for name, constraint in constraints.items():
+            # the accessor belongs to the concrete model declaring the
+            # field, not to its subclasses
+            inherited = any(
+                base.__dict__.get(name) is constraint and
+                not getattr(base, 'abstract', False)
+                for base in cls.__mro__[1:])
+
             # we need to assign name every time class is created.
             constraint.name = constraint.name or constraint.apply_prefix(name)
             for name, column in constraint.get_fk_columns().items():
                 setattr(cls, name, column)
 
+            if inherited:
+                continue
+
+            reverse = fields.ReverseReference(cls, constraint)
+            metacls.check_reverse_name(constraint.reference, reverse)
+            setattr(constraint.reference, reverse.name, reverse)
+
         # Need to call the function because `column` is outdated
         # because foreign key column may have been added by the above
         # code
@@ -58,5 +85,148 @@ class MetaCls(type):
 
             columns[key_name] = key_col
 
+        # Fields checked by `Model.validate`
+        cls._fields = tuple(
+            (name, column) for name, column in columns.items()
+            if isinstance(column, fields.Field)
+        )
+
         connection.add_model(cls)
         return cls
+
+    @classmethod
+    def resolve_options(metacls, cls, namespace):
+        """Store the model options declared by `cls` in their private
+        attributes, see `OPTIONS`
+
+        Options are read from the private attributes only, so a field
+        named like an option does not replace it. Declaring an option
+        with the name of a field of a base class raises `ValueError`.
+        Options which are not declared are inherited.
+        """
+        field_types = (fields.Field, fields.ReferenceField)
+        for option, attr in metacls.OPTIONS:
+            if option not in namespace or \
+                    isinstance(namespace[option], field_types):
+                continue
+
+            for base in cls.__mro__[1:]:
+                if isinstance(base.__dict__.get(option), field_types):
+                    detail = "`%s` is a field of `%s`, it cannot be " \
+                        "used as model option" % (option, base.__name__)
+                    raise ValueError(detail)
+
+            value = namespace[option]
+            if option == 'validation' and value not in \
+                    (None, fields.STRICT, fields.OFF, fields.DEFERRED):
+                raise ValueError("Unknown validation mode `%s`" % value)
+            if option == 'shard_function':
+                if isinstance(value, staticmethod):
+                    value = value.__func__
+                # not bound to the instances
+                value = staticmethod(value) if value is not None else None
+
+            setattr(cls, attr, value)
+
+    @staticmethod
+    def check_reverse_name(reference, reverse):
+        """Raise `ValueError` if the name of accessor `reverse` is
+        already used by `reference`
+
+        The accessor of a redefined model replaces the previous one.
+        """
+        if not hasattr(reference, reverse.name):
+            return
+
+        existing = getattr(reference, reverse.name)
+        if isinstance(existing, fields.ReverseReference) and \
+                existing.model.__name__ == reverse.model.__name__:
+            return
+
+        detail = "`%s` is already defined on `%s`, pass another " \
+            "`related_name` to the `ReferenceField` of `%s`" % (
+                reverse.name, reference.__name__, reverse.model.__name__)
+        raise ValueError(detail)
+
+    @staticmethod
+    def _own_slots(namespace):
+        slots = namespace.get('__slots__', ())
+        if isinstance(slots, str):
+            slots = (slots,)
+        return tuple(slots)
+
+    @staticmethod
+    def check_slot_bases(bases):
+        """Raise `TypeError` if several of `bases` add slots, which
+        Python cannot lay out in a single instance
+        """
+        layouts = []
+        for base in bases:
+            # the nearest class adding slots other than `__dict__`
+            for klass in base.__mro__:
+                slots = MetaCls._own_slots(klass.__dict__)
+                if set(slots) - {'__dict__', '__weakref__'}:
+                    layouts.append(klass)
+                    break
+
+        for i, layout in enumerate(layouts):
+            for other in layouts[i + 1:]:
+                if issubclass(layout, other) or issubclass(other, layout):
+                    continue
+                detail = "`%s` and `%s` both store their fields in " \
+                    "slots, add `__slots__ = ('__dict__',)` to them to " \
+                    "inherit from both" % (layout.__name__, other.__name__)
+                raise TypeError(detail)
+
+    @staticmethod
+    def get_slots(bases, namespace):
+        """Slots holding the values of the fields of the model
+
+        `Field` stores its value in the `_prop__<name>` attribute of
+        the instance and `ReferenceField` caches the referenced
+        instance in `cache_<name>`. Declaring them as slots keeps model
+        instances free of a `__dict__`. Slots are computed before the
+        class is created, so the foreign key and automatic primary key
+        columns added further down are included. A model declaring
+        `__slots__ = ('__dict__',)` gets no generated slots, its field
+        values and arbitrary attributes are stored in `__dict__`.
+
+        Python cannot combine two bases which both add slots, a model
+        inheriting from several concrete models raises `TypeError`
+        unless they are declared with `__slots__ = ('__dict__',)`.
+        """
+        slots = list(MetaCls._own_slots(namespace))
+        MetaCls.check_slot_bases(bases)
+
+        inherited = set()
+        inherited_columns = []
+        for base in bases:
+            for klass in base.__mro__:
+                inherited.update(klass.__dict__)
+                inherited_columns.extend(
+                    v for v in klass.__dict__.values()
+                    if isinstance(v, fields.Field))
+
+        if '__dict__' in slots:
+            return tuple(s for s in slots if s not in inherited)
+
+        columns = []
+        for attr, value in namespace.items():
+            if isinstance(value, fields.Field):
+                columns.append(value.name or attr)
+            elif isinstance(value, fields.ReferenceField):
+                columns.extend(value.get_fk_columns().keys())
+                constraint_name = value.name or value.apply_prefix(attr)
+                slots.append('cache_%s' % constraint_name)
+
+        abstract = namespace.get(
+            'abstract', any(getattr(b, 'abstract', False) for b in bases))
+        has_key = any(v.primary_key for v in inherited_columns) or any(
+            getattr(v, 'primary_key', False) for v in namespace.values()
+            if isinstance(v, fields.Field))
+        if not abstract and not has_key and \
+                (columns or inherited_columns):
+            columns.append('id')
+
+        slots.extend(fields.Field._apply_suffix(c) for c in columns)
+        return tuple(s for s in slots if s not in inherited)
@@ -1,8 +1,11 @@
 import sys
+import zlib
 import json
+import uuid
 import sqlalchemy
 import collections
 
+from mangrove import bulk
 from mangrove import query
 from mangrove import fields
 from mangrove import exceptions
@@ -37,11 +40,74 @@ class Model(base.ModelBase):
     -----------
 
     To add primary key to the table add `primary_key=True` to columns
+
+
+    Storage
+    -------
+
+    Instances have no `__dict__`, field values are stored in slots and
+    setting an attribute which is not a field raises `AttributeError`.
+    Add `__slots__ = ('__dict__',)` to the model to store field values
+    in `__dict__` and allow setting arbitrary attributes. A model can
+    only inherit from several concrete models declared this way.
+
+
+    Model options
+    -------------
+
+    The options below are read when the class is created. A field can
+    be named like an option, the option is then inherited.
+
+
+    Sharding
+    --------
+
+    shard_key:
+        Name of the column which decides the shard of a row when
+        `connection.ShardedConnection` is installed.
+
+    shard_function:
+        Callable receiving the value of the shard key and the number
+        of shards and returning the index of the shard. Defaults to a
+        stable hash of the value.
+
+
+    Validation
+    ----------
+
+    validation:
+        Validation mode of the model, `strict`, `off` or `deferred`.
+        Defaults to the mode set with `fields.set_validation_mode`.
+
+
+    Write-behind
+    ------------
+
+    write_behind:
+        A `writebehind.WriteBehind` buffer. `save` queues the row
+        which is inserted later in a batch.
     """
 
     abstract = False
 
+    # model options resolved by `MetaCls.resolve_options`
+    _shard_key = None
+    _shard_function = None
+    _write_behind = None
+    _validation_mode = None
+
+    # (name, field) pairs checked by `validate`, set by `MetaCls`
+    _fields = ()
+
+    # Field values are kept in slots generated by `MetaCls.get_slots`.
+    # `_deferred` holds the names of columns not loaded yet and
+    # `_deferred_loader` the loader which loads them, see `Query.defer`.
+    # `_prefetched` holds the results of `Query.prefetch_related`.
+    __slots__ = ('_deferred', '_deferred_loader', '_prefetched',
+                 '__weakref__')
+
     def __init__(self, **kwargs):
+        self._deferred = None
         for name, value in kwargs.items():
             setattr(self, name, value)
 
@@ -65,6 +131,23 @@ class Model(base.ModelBase):
         columns = cls.get_columns().values()
         return tuple(sorted(p.name for p in columns if p.primary_key))
 
+    @classmethod
+    def get_shard(cls, value, num_shards):
+        """Index of the shard holding rows with shard key `value`
+        """
+        shard_function = cls._shard_function
+        if shard_function is None:
+            if isinstance(value, int) and not isinstance(value, bool):
+                return value % num_shards
+            value = str(value).encode('utf-8')
+            return zlib.crc32(value) % num_shards
+
+        return shard_function(value, num_shards)
+
+    @classmethod
+    def get_validation_mode(cls):
+        return cls._validation_mode or fields.get_validation_mode()
+
     @classmethod
     def get_table(cls):
         """Return the underlying SQLAlchemy table
@@ -110,6 +193,179 @@ class Model(base.ModelBase):
 
         return query.get()
 
+    @classmethod
+    def get_many(cls, keys, chunk_size=500, temp_table_threshold=10000):
+        """Fetch the entities with primary key in `keys`
+
+        .. code
+        >>> Person.get_many([1, 2, 3])
+        {(1,): Person(...), (2,): Person(...), (3,): None}
+
+        Keys are values of the primary key, or tuples ordered as
+        `get_key_name()` for composite keys. Values are converted with
+        `Field.to_python` of the key fields. Returns a dict keyed by
+        converted key tuple, keys without a row map to `None`.
+
+        Keys are looked up with `IN` queries of `chunk_size` keys. If
+        there are more than `temp_table_threshold` keys they are
+        inserted in a temporary table which is joined with the model
+        table instead, unless the reads go to a replica or to several
+        shards, which only run the `IN` queries.
+        """
+        key_name = cls.get_key_name()
+        columns = dict((c.name, c) for c in cls.get_columns().values())
+        key_fields = [columns[k] for k in key_name]
+
+        result = collections.OrderedDict()
+        for key in keys:
+            if not isinstance(key, tuple):
+                key = (key,)
+            if len(key) != len(key_name):
+                detail = "Key `%s` does not match `%s`" % (key, key_name)
+                raise ValueError(detail)
+            key = tuple(f.to_python(v) for f, v in zip(key_fields, key))
+            result[key] = None
+
+        conn = connection.get_connection()
+        reader = conn.reader(cls.select())
+        # the temporary table is written, it needs the primary
+        if len(result) > temp_table_threshold and reader is conn.writer():
+            instances = cls._get_many_temp_table(reader, list(result))
+        else:
+            instances = cls._get_many_in(list(result), chunk_size)
+
+        for instance in instances:
+            key = tuple(getattr(instance, k) for k in key_name)
+            if key in result:
+                result[key] = instance
+
+        return dict(result)
+
+    @classmethod
+    def _get_many_in(cls, keys, chunk_size):
+        table = cls.get_table()
+        key_columns = [table.columns[k] for k in cls.get_key_name()]
+
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            if len(key_columns) == 1:
+                clause = key_columns[0].in_([k[0] for k in chunk])
+            else:
+                clause = sqlalchemy.tuple_(*key_columns).in_(chunk)
+
+            for instance in cls.select().where(clause):
+                yield instance
+
+    @classmethod
+    def _get_many_temp_table(cls, conn, keys):
+        table = cls.get_table()
+        key_name = cls.get_key_name()
+
+        columns = [
+            sqlalchemy.Column(k, table.columns[k].type, primary_key=True)
+            for k in key_name
+        ]
+        name = '_mangrove_keys_%s' % uuid.uuid4().hex
+        temp = sqlalchemy.Table(
+            name, sqlalchemy.MetaData(), *columns, prefixes=['TEMPORARY'])
+
+        join = table.join(temp, sqlalchemy.and_(
+            *[table.columns[k] == temp.columns[k] for k in key_name]))
+        query = cls.select()
+        query.stmt = query.stmt.select_from(join)
+
+        with conn.transaction():
+            conn.execute(sqlalchemy.schema.CreateTable(temp))
+            try:
+                conn.execute(temp.insert(),
+                             [dict(zip(key_name, k)) for k in keys])
+                rows = conn.execute(query.stmt).fetchall()
+            finally:
+                conn.execute(sqlalchemy.schema.DropTable(temp))
+
+        return list(query._load(rows))
+
+    @classmethod
+    def load_csv(cls, path_or_file, batch_size=1000, upsert=False,
+                 on_reject=None, progress=None, **csv_kwargs):
+        """Stream rows from a CSV file with a header into the table
+
+        .. code
+        >>> report = Person.load_csv('people.csv', upsert=True)
+        >>> report.rows, report.rejected, report.rows_per_second
+
+        Cells are converted with `Field.to_python` and inserted in
+        `executemany` batches of `batch_size` rows inside a
+        transaction. Rows which cannot be converted are rejected and
+        reported, `upsert` replaces rows with the same primary key.
+        `csv_kwargs` are passed to `csv.DictReader`.
+
+        See `bulk.load_rows` for the arguments.
+
+        :returns: `bulk.LoadReport`
+        """
+        rows = bulk.read_csv(path_or_file, **csv_kwargs)
+        return bulk.load_rows(cls, rows, batch_size=batch_size,
+                              upsert=upsert, on_reject=on_reject,
+                              progress=progress)
+
+    @classmethod
+    def load_jsonl(cls, path_or_file, batch_size=1000, upsert=False,
+                   on_reject=None, progress=None):
+        """Stream rows from a JSON lines file into the table
+
+        Every line holds one JSON object. Lines which are not JSON
+        objects are rejected. See `load_csv`.
+
+        :returns: `bulk.LoadReport`
+        """
+        rows = bulk.read_jsonl(path_or_file)
+        return bulk.load_rows(cls, rows, batch_size=batch_size,
+                              upsert=upsert, on_reject=on_reject,
+                              progress=progress)
+
+    @classmethod
+    def save_many(cls, instances, batch_size=1000):
+        """ Insert `instances` with `executemany`
+
+        Instances are validated before anything is written if the
+        validation mode is `deferred`. Rows are inserted in batches of
+        `batch_size` inside a transaction per connection written to.
+        Primary keys generated by the database are not set on the
+        instances.
+        """
+        instances = list(instances)
+        if cls.get_validation_mode() == fields.DEFERRED:
+            for instance in instances:
+                instance.validate()
+
+        conn = connection.get_connection()
+        names = list(cls.get_columns())
+        groups = collections.OrderedDict()
+        for instance in instances:
+            writer = conn.writer(instance)
+            data = dict((p, getattr(instance, p)) for p in names)
+            groups.setdefault(id(writer), (writer, []))[1].append(data)
+
+        table = cls.get_table()
+        for writer, rows in groups.values():
+            with writer.transaction():
+                for start in range(0, len(rows), batch_size):
+                    writer.execute(table.insert(),
+                                   rows[start:start + batch_size])
+
+    def validate(self):
+        """ Check the types of the values of all fields
+
+        Raises `ValueError` for the first field holding a value of the
+        wrong type. Deferred fields which were not loaded are skipped.
+        """
+        deferred = self._deferred
+        for name, field in self._fields:
+            if deferred and field.name in deferred:
+                continue
+            field._check_type(field, getattr(self, name))
+
     @property
     def key(self):
         _key = tuple(getattr(self, p) for p in self.get_key_name())
@@ -120,11 +376,24 @@ class Model(base.ModelBase):
 
         It is an error to use this method for record which
         already exists.
+
+        With write-behind enabled, on the model or on the connection,
+        the row is queued and `None` is returned.
         """
 
+        if self.get_validation_mode() == fields.DEFERRED:
+            self.validate()
+
+        conn = connection.get_connection()
+        writer = conn.writer(self)
+        write_behind = self._write_behind or conn.write_behind
+        if write_behind is not None and not writer.in_transaction():
+            write_behind.enqueue(self)
+            return None
+
         data = {p: getattr(self, p) for p in self.get_columns()}
         stmt = self.get_table().insert().values(**data)
-        result = connection.get_connection().execute(stmt)
+        result = writer.execute(stmt)
 
         # set the key on the model
         key_name = self.get_key_name()
@@ -139,6 +408,9 @@ class Model(base.ModelBase):
         Issues update statement to the database. This function will
         update the corressponding row with the properties of the object.
 
+        Columns deferred by the query which loaded the entity and not
+        accessed or assigned since are not updated.
+
         Arguments
         ---------
         @exclude: A list of column names that you want to exclude from
@@ -148,9 +420,15 @@ class Model(base.ModelBase):
         if not self.key:
             return
 
+        if self.get_validation_mode() == fields.DEFERRED:
+            self.validate()
+
         ReferenceField = fields.ReferenceField
 
         _exclude = list(self.get_key_name())
+
+        # never overwrite columns which were not loaded
+        _exclude.extend(self._deferred or [])
         for e in exclude:
             class_field = getattr(self.__class__, e)
             if isinstance(class_field, ReferenceField):
@@ -169,7 +447,7 @@ class Model(base.ModelBase):
         for col_name, col_value in zip(self.get_key_name(), self.key):
             stmt = stmt.where(table.columns[col_name] == col_value)
 
-        return connection.get_connection().execute(stmt)
+        return connection.get_connection().writer(self).execute(stmt)
 
     def update_or_save(self):
         """ Update or insert new record
@@ -194,6 +472,6 @@ class Model(base.ModelBase):
         for col_name, col_value in zip(key_name, key):
             stmt = stmt.where(table.columns[col_name] == col_value)
 
-        result = connection.get_connection().execute(stmt)
+        result = connection.get_connection().writer(self).execute(stmt)
         if result.rowcount:
             return result
@@ -3,4 +3,5 @@ import metacls
 
 class ModelBase():
     __metaclass__ = metacls.MetaCls
+    __slots__ = ()
     abstract = True
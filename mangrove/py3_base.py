@@ -2,4 +2,5 @@ from mangrove import metacls
 
 
 class ModelBase(metaclass=metacls.MetaCls):
+    __slots__ = ()
     abstract = True
@@ -1,5 +1,15 @@
 import sys
+import copy
+import uuid
+import weakref
+import functools
+import multiprocessing
+
 import sqlalchemy
+from mangrove import bulk
+from mangrove import counts
+from mangrove import advisor
+from mangrove import fields
 from mangrove import connection
 
 
@@ -28,10 +38,38 @@ class SelectStatement(Base):
         else:
             self.stmt = sqlalchemy.select(columns or funcs)
 
+        self._using = None
+
     def execute(self, *args, **kwargs):
         """ Executes the statement using the default connection
         """
-        return connection.get_connection().execute(self.stmt)
+        return self._execute(self.stmt)
+
+    def using(self, name):
+        """ Execute the statement on the connection named `name`
+
+        .. code
+        >>> Person.select().using('primary').fetch()
+
+        See `connection.RoutingConnection`.
+        """
+        self._using = name
+        return self
+
+    def _execute(self, stmt, reader=None):
+        if advisor._workloads and isinstance(self, Query):
+            advisor.observe(self)
+
+        return (reader or self._reader()).execute(stmt)
+
+    def _reader(self):
+        """ Connection on which the statement is executed
+        """
+        conn = connection.get_connection()
+        if self._using is None:
+            return conn.reader(self)
+
+        return conn.route(self._using, self)
 
     def where(self, *args, **kwargs):
         """  Adds where clause to the select statement
@@ -63,14 +101,62 @@ class Query(SelectStatement):
         :param list columns: Columns which will be included in the query
         """
         self.model = model
-        columns = columns or [model.get_table()]
+        self._defer = set()
+        self._only = None
+        self._prefetch = ()
+        self._joins = ()
+        self._tuples = False
+        self._result_cache = None
+        columns = columns or self._selected_columns()
         super(Query, self).__init__(columns=columns)
 
+    PREFETCH_BATCH_SIZE = 500
+
     def __iter__(self):
         """ Allows query object to be iterated over
         """
-        for row in self.execute():
-            yield self.model(**dict(row))
+        cache = self._cached()
+        if cache is not None:
+            for instance in cache:
+                yield instance
+            return
+
+        for instance in self._load(self.execute()):
+            yield instance
+
+    def __getitem__(self, key):
+        """ Slice the query, LIMIT and OFFSET are compiled into the SQL
+
+        .. code
+        >>> Person.select()[10:20]  # list of at most 10 persons
+        >>> Person.select()[5]      # sixth person, IndexError if missing
+        """
+        if isinstance(key, slice):
+            start, stop, step = key.start, key.stop, key.step
+            if step is not None:
+                raise ValueError("Query slicing does not support steps")
+            if (start is not None and start < 0) or \
+                    (stop is not None and stop < 0):
+                raise ValueError("Query slicing does not support negative "
+                                 "indices")
+
+            return self._slice(start or 0, stop)._fetchall()
+
+        if key < 0:
+            raise ValueError("Query indexing does not support negative "
+                             "indices")
+
+        item = self._slice(key, key + 1)._first()
+        if item is None:
+            raise IndexError("Query index out of range")
+
+        return item
+
+    def where(self, *args, **kwargs):
+        if self._joins:
+            args = [self._bind_columns(a) for a in args]
+
+        return super(Query, self).where(*args, **kwargs)
 
     def order_by(self, *args, **kwargs):
         """ Adds orderby clause to the query
@@ -81,42 +167,769 @@ class Query(SelectStatement):
         >>> Query(Model).order_by('-id').fetch()
         >>> Query(Model).order_by(-Person.id).fetch()
         """
+        if self._joins:
+            args = [self._bind_columns(a) for a in args]
+
         self.stmt = self.stmt.order_by(*args, **kwargs)
         return self
 
+    def defer(self, *fields):
+        """ Do not select `fields`, they are loaded on first access
+
+        .. code
+        >>> for post in Post.select().defer(Post.body, 'summary'):
+                print(post.title)
+
+        Accessing a deferred field loads it for all the instances
+        returned by the query with a single statement per batch.
+        Fields with `deferred=True` are always deferred unless they are
+        listed in `only`.
+        """
+        self._defer = self._defer.union(self._field_names(fields))
+        self.stmt = self.stmt.with_only_columns(self._selected_columns())
+        return self
+
+    def only(self, *fields):
+        """ Select only `fields` and the primary key, defer the rest
+
+        .. code
+        >>> Post.select().only(Post.title).fetch()
+        """
+        self._only = set(self._field_names(fields))
+        self.stmt = self.stmt.with_only_columns(self._selected_columns())
+        return self
+
+    def prefetch_related(self, *names):
+        """ Load the children of the returned instances in batches
+
+        .. code
+        >>> for parent in Parent.select().prefetch_related('child_set'):
+                print(parent.child_set.fetch())  # no query
+
+        `names` are reverse accessors, see `fields.ReverseReference`.
+        Children are loaded with one `IN` query per batch of
+        `PREFETCH_BATCH_SIZE` instances and grouped in Python.
+        """
+        for name in names:
+            accessor = getattr(self.model, name, None)
+            if not isinstance(accessor, fields.ReverseReference):
+                detail = "`%s` is not a reverse reference of `%s`" % (
+                    name, self.model.__name__)
+                raise ValueError(detail)
+
+        self._prefetch = self._prefetch + names
+        return self
+
+    def join(self, reference, outer=False):
+        """ Load the instances referenced by `reference` in the same SELECT
+
+        .. code
+        >>> for child in Child.select().join(Child.parent):
+                print(child.parent.name)  # no query
+
+        >>> Child.select().join('parent', outer=True).where(
+                Parent.name == 'John Doe')
+
+        `reference` is a `ReferenceField` of the model, or its name. The
+        ON clause is built from its foreign key columns and the columns
+        of the referenced model are selected with labels prefixed by
+        the constraint name, so they never clash with the columns of
+        the model. The referenced instance is stored in the reference
+        cache of every instance. An outer join keeps the instances
+        without a referenced row, their reference is `None`.
+        """
+        if not isinstance(reference, fields.ReferenceField):
+            reference = getattr(self.model, reference, None)
+
+        constraints = self.model.get_constraints().values()
+        if not any(reference is c for c in constraints):
+            detail = "`%s` is not a reference of `%s`" % (
+                getattr(reference, 'name', reference), self.model.__name__)
+            raise ValueError(detail)
+
+        if any(join.field is reference for join in self._joins):
+            return self
+
+        join = _Join(reference, outer)
+        self._joins = self._joins + (join,)
+
+        clause = self.model.get_table()
+        for join in self._joins:
+            clause = join.join(self.model, clause)
+
+        self.stmt = self._bind_columns(self.stmt.select_from(clause))
+        self.stmt = self.stmt.with_only_columns(self._selected_columns())
+        return self
+
+    def tuples(self):
+        """ Return `(instance, referenced, ...)` tuples
+
+        .. code
+        >>> for child, parent in Child.select().join(Child.parent).tuples():
+                print(child.name, parent.name)
+
+        The referenced instances follow the order of the `join` calls.
+        """
+        self._tuples = True
+        return self
+
+    def limit(self, limit):
+        """ Adds LIMIT clause to the query
+
+        .. code
+        >>> Query(Model).limit(10).fetch()
+        """
+        self.stmt = self.stmt.limit(limit)
+        return self
+
+    def offset(self, offset):
+        """ Adds OFFSET clause to the query
+
+        .. code
+        >>> Query(Model).order_by('id').offset(10).limit(10).fetch()
+        """
+        self.stmt = self.stmt.offset(offset)
+        return self
+
+    def timeout(self, seconds):
+        """ Cancel the statements of the query running longer than
+        `seconds`
+
+        .. code
+        >>> try:
+                Person.select().timeout(2.5).fetch()
+            except exceptions.QueryTimeoutError:
+                ...
+
+        Overrides the `statement_timeout` of the connection, `0`
+        disables it. SQLite statements are interrupted from a progress
+        handler, PostgreSQL and MySQL statements by the server side
+        statement timeout. The rows are fetched before the timeout
+        expires, so results are not streamed.
+        """
+        self.stmt = self.stmt.execution_options(timeout=seconds)
+        return self
+
     def fetch(self, size=None):
         if size is None:
             return self._fetchall()
         else:
-            return self._fetchmany(size)
+            return self._slice(0, size)._fetchall()
 
     def get(self):
-        return self._first()
+        cache = self._cached()
+        if cache is not None:
+            return cache[0] if cache else None
+
+        return self._slice(0, 1)._first()
 
-    def count(self):
+    def exists(self):
+        """ Return `True` if the query matches at least one row
+
+        Runs `SELECT EXISTS (...)` so the database can stop at the
+        first match.
+        """
+        cache = self._cached()
+        if cache is not None:
+            return bool(cache)
+
+        stmt = sqlalchemy.select([sqlalchemy.exists(self.stmt)])
+        stmt = stmt.execution_options(**self.stmt.get_execution_options())
+        return bool(self._execute(stmt).scalar())
+
+    def count(self, approximate=False, cache=False):
+        """ Number of rows returned by the query
+
+        .. code
+        >>> Person.select().count(approximate=True)
+        >>> Person.select().where(Person.age > 30).count(cache=True)
+
+        With `approximate` the number is read from the statistics of
+        the database: `sqlite_stat1`, filled by `ANALYZE`, or
+        `pg_class.reltuples` and the planner's estimate for filtered
+        PostgreSQL queries. Queries the statistics do not cover are
+        counted exactly.
+
+        With `cache` exact counts are cached per connection until
+        mangrove writes to one of the tables of the query, see
+        `counts.CountCache`.
+        """
+        cached = self._cached()
+        if cached is not None:
+            return len(cached)
+
+        if approximate:
+            count = advisor.estimate(self)
+            if count is not None:
+                return self._limit_count(count)
+
+        stmt = self._count_statement()
+        if cache:
+            reader = self._reader()
+            count = counts.cache.count(
+                stmt, lambda: self._execute(stmt, reader).scalar(), reader)
+        else:
+            count = self._execute(stmt).scalar()
+
+        return self._limit_count(count)
+
+    def _clone(self):
+        """ Return a copy of the query
+
+        The underlying sqlalchemy statement is generative so a shallow
+        copy is enough for the clone to be modified independently.
+        """
+        return copy.copy(self)
+
+    def _slice(self, start, stop=None):
+        """ Copy of the query returning rows `start` to `stop` of the
+        rows returned by this query
+        """
+        offset = self.stmt._offset or 0
+        limit = self.stmt._limit
+        if limit is not None:
+            stop = limit if stop is None else min(stop, limit)
+
+        query = self._clone()
+        if start:
+            query.offset(offset + start)
+        if stop is not None:
+            query.limit(max(stop - start, 0))
+
+        return query
+
+    def partitions(self, n):
+        """ Split the query in at most `n` queries over key ranges
+
+        .. code
+        >>> for query in Person.select().partitions(4):
+                print(query.count())
+
+        The ranges are taken over the first column of `get_key_name()`
+        so that every partition holds about the same number of rows.
+        Partitions may be fewer than `n` if the rows are few or share
+        key values.
+
+        Every boundary is found with an `ORDER BY key OFFSET k LIMIT 1`
+        query, after a `count`. The database steps over the skipped
+        rows, even with an index on the key, so splitting reads about
+        `n / 2` times the rows of the query. Keep `n` small on large
+        tables.
+        """
+        if n < 1:
+            raise ValueError("At least one partition is required")
+        if self.stmt._limit is not None or self.stmt._offset:
+            raise ValueError("Limited queries cannot be partitioned")
+
+        key_name = self.model.get_key_name()[0]
+        key_column = self.model.get_table().columns[key_name]
+
+        count = self.count()
+        boundaries = []
+        for k in range(1, n):
+            offset = k * count // n
+            if not offset:
+                # the smallest key would make an empty first partition
+                continue
+
+            stmt = self.stmt.with_only_columns([key_column])
+            stmt = stmt.order_by(None).order_by(key_column)
+            stmt = stmt.offset(offset).limit(1)
+            value = self._execute(stmt).scalar()
+            if value is not None and \
+                    (not boundaries or value > boundaries[-1]):
+                boundaries.append(value)
+
+        queries = []
+        lower = None
+        for upper in boundaries + [None]:
+            query = self._clone()
+            if lower is not None:
+                query.where(key_column >= lower)
+            if upper is not None:
+                query.where(key_column < upper)
+            queries.append(query)
+            lower = upper
+
+        return queries
+
+    def parallel_map(self, func, workers=None, partitions=None,
+                     reduce=None, initial=None):
+        """ Call `func` for every instance in a pool of processes
+
+        .. code
+        >>> for result in Person.select().parallel_map(score, workers=4):
+                print(result)
+
+        >>> Person.select().parallel_map(
+                lambda p: p.age, reduce=operator.add, initial=0)
+
+        The query is split in `partitions` key ranges, four per worker
+        by default, which are scanned in separate processes. Every
+        process discards the inherited DB connections and opens its
+        own, so the database has to be reachable from several
+        processes, e.g. a file backed SQLite database.
+
+        Without `reduce` the results of `func` are yielded as the
+        partitions complete, in no particular order. With `reduce` every
+        process reduces the results of its partition, the reduced
+        partitions are reduced in turn starting from `initial`, so
+        `initial` is used once. `reduce` must be associative. Returns
+        `initial` if the query returns no rows.
+
+        Processes are forked, so `func` and the model need not be
+        picklable, the results do.
+        """
+        workers = workers or multiprocessing.cpu_count()
+        queries = self.partitions(partitions or workers * 4)
+        results = _parallel_scan(queries, func, workers, reduce)
+
+        if reduce is None:
+            return (r for partition in results for r in partition)
+
+        values = [value for found, value in results if found]
+        if initial is not None:
+            values.insert(0, initial)
+
+        return functools.reduce(reduce, values) if values else initial
+
+    def prepare(self):
+        """ Return a `PreparedQuery` which runs this query with new
+        values of its bind parameters
+
+        .. code
+        >>> by_name = Person.select().where(
+                Person.name == sqlalchemy.bindparam('name')
+            ).order_by(Person.age).prepare()
+        >>> by_name.fetch(name='Foobar')
+        >>> by_name.get(name='Foobar')
+
+        The statement is built once and compiled once per dialect.
+        """
+        return PreparedQuery(self)
+
+    def explain(self):
+        """ Return the plan of the query as an `advisor.QueryPlan`
+
+        .. code
+        >>> plan = Person.select().where(Person.name == 'Foobar').explain()
+        >>> plan.full_scans
+        ['Person']
+
+        Runs the dialect's EXPLAIN, `EXPLAIN QUERY PLAN` on SQLite, on
+        the compiled statement.
+        """
+        return advisor.explain(self)
+
+    def to_jsonl(self, path_or_file, chunk_size=1000):
+        """ Stream the selected columns to a JSON lines file
+
+        .. code
+        >>> with open('people.jsonl', 'w') as fp:
+                Person.select().where(Person.age > 30).to_jsonl(fp)
+
+        Rows are fetched `chunk_size` at a time from the cursor and
+        written without creating model instances. Datetimes are
+        written in ISO 8601 format. Deferred fields are not exported.
+
+        :returns: Number of rows written
+        """
+        return bulk.dump_jsonl(self._stream(), path_or_file, chunk_size)
+
+    def to_csv(self, path_or_file, chunk_size=1000, **csv_kwargs):
+        """ Stream the selected columns to a CSV file with a header
+
+        See `to_jsonl`, `csv_kwargs` are passed to `csv.writer`.
+
+        :returns: Number of rows written
+        """
+        return bulk.dump_csv(self._stream(), path_or_file, chunk_size,
+                             **csv_kwargs)
+
+    def _stream(self):
+        """ Execute the query with a server side cursor if possible
+        """
+        return self._execute(self.stmt.execution_options(stream_results=True))
+
+    def _count_statement(self):
+        """ Statement counting the rows, ignoring LIMIT and OFFSET
+        """
         stmt = self.stmt.with_only_columns([sqlalchemy.func.count()])
         stmt = stmt.select_from(self.model.get_table())
-        return SelectStatement(stmt=stmt).execute().scalar()
+        return stmt.limit(None).offset(None).order_by(None)
 
-    def _fetchall(self, *multiparams, **params):
-        """ Return all rows as list
+    def _limit_count(self, count):
+        """ Apply LIMIT/OFFSET to the number of rows matching the query
         """
-        items = self.execute(*multiparams, **params).fetchall()
-        return [self.model(**dict(row)) for row in items]
+        count = max(count - (self.stmt._offset or 0), 0)
+        if self.stmt._limit is not None:
+            count = min(count, self.stmt._limit)
+
+        return count
+
+    def _cached(self):
+        """ Prefetched results, if the query was not modified since
+        """
+        if self._result_cache is None:
+            return None
 
-    def _fetchmany(self, size=None, *multiparams, **params):
-        """ Return a particular number of rows
+        stmt, instances = self._result_cache
+        return instances if stmt is self.stmt else None
 
-        :param int size: The number of rows which should be returned
+    def _bind_columns(self, clause):
+        """ Replace the columns of the models in `clause` by the columns
+        of their tables
+
+        The tables hold copies of the model columns, model columns are
+        rendered without the table name which is ambiguous once other
+        tables are joined.
         """
-        items = self.execute(*multiparams, **params).fetchmany(size)
-        return [self.model(**dict(row)) for row in items]
+        if not isinstance(clause, sqlalchemy.sql.ClauseElement):
+            return clause
+
+        columns = {}
+        for model in (self.model,) + tuple(j.model for j in self._joins):
+            table = model.get_table()
+            for column in model.get_columns().values():
+                columns.setdefault(id(column), table.columns[column.name])
+
+        def replace(element):
+            return columns.get(id(element))
+
+        return sqlalchemy.sql.visitors.replacement_traverse(
+            clause, {}, replace)
+
+    def _field_names(self, fields):
+        return [getattr(f, 'name', f) for f in fields]
+
+    def _deferred_names(self):
+        """ Names of the columns which are not selected
+        """
+        columns = self.model.get_columns().values()
+        key_name = self.model.get_key_name()
+
+        if self._only is not None:
+            names = set(c.name for c in columns) - self._only
+        else:
+            names = set(c.name for c in columns
+                        if getattr(c, 'deferred', False))
+            names.update(self._defer)
+
+        return names.difference(key_name)
+
+    def _selected_columns(self):
+        table = self.model.get_table()
+        deferred = self._deferred_names()
+        if not deferred:
+            columns = [table]
+        else:
+            columns = [c for c in table.columns if c.name not in deferred]
+
+        for join in self._joins:
+            columns.extend(join.columns)
+
+        return columns
+
+    def _load(self, rows):
+        """ Create model instances from `rows`
+        """
+        deferred = self._deferred_names()
+        loader = _DeferredLoader(self, deferred) if deferred else None
+
+        # joined rows also hold the labelled columns of the references
+        joins = [(join, join.loader(self)) for join in self._joins]
+        names = [c.name for c in self.model.get_table().columns
+                 if c.name not in deferred]
+
+        batch = []
+        for row in rows:
+            if joins:
+                instance = self.model(**{name: row[name] for name in names})
+            else:
+                instance = self.model(**dict(row))
+
+            if loader is not None:
+                loader.add(instance)
+
+            related = ()
+            for join, join_loader in joins:
+                referenced = join.load(row, join_loader)
+                setattr(instance, join.cache_name, referenced)
+                related += (referenced,)
+
+            item = (instance,) + related if self._tuples else instance
+            if not self._prefetch:
+                yield item
+                continue
+
+            batch.append(item)
+            if len(batch) >= self.PREFETCH_BATCH_SIZE:
+                for item in self._prefetch_batch(batch):
+                    yield item
+                batch = []
+
+        for item in self._prefetch_batch(batch):
+            yield item
+
+    def _prefetch_batch(self, items):
+        if items:
+            instances = [i[0] for i in items] if self._tuples else items
+            for name in self._prefetch:
+                getattr(self.model, name).prefetch(instances)
+
+        return items
+
+    def _fetchall(self, *multiparams, **params):
+        """ Return all rows as list
+        """
+        cache = self._cached()
+        if cache is not None:
+            return list(cache)
+
+        items = self.execute(*multiparams, **params).fetchall()
+        return list(self._load(items))
 
     def _first(self, *multiparams, **params):
         """ Return first row
         """
         item = self.execute(*multiparams, **params).first()
-        try:
-            return self.model(**dict(item))
-        except TypeError:
+        if item is None:
+            return None
+
+        return next(self._load([item]))
+
+
+class PreparedQuery(object):
+    """ A query compiled once and executed with bind parameter values
+
+    Created with `Query.prepare`. Values of the `sqlalchemy.bindparam`
+    placeholders of the query are passed as keyword arguments. The
+    query must not be modified after it is prepared.
+
+    Queries fanned out to several shards are compiled on every call.
+    """
+
+    def __init__(self, query):
+        self.query = query._clone()
+        self._statements = {
+            'fetch': self.query.stmt,
+            'get': self.query.stmt.limit(1),
+            'count': self.query._count_statement(),
+        }
+
+        # (kind, dialect) -> compiled statement
+        self._compiled = {}
+
+    def __iter__(self):
+        return iter(self.fetch())
+
+    def fetch(self, **params):
+        return list(self.iterate(**params))
+
+    def iterate(self, **params):
+        """ Yield the instances as the rows are fetched
+        """
+        return self.query._load(self._execute('fetch', params))
+
+    def get(self, **params):
+        row = self._execute('get', params).first()
+        if row is None:
             return None
+
+        return next(self.query._load([row]))
+
+    def count(self, **params):
+        count = self._execute('count', params).scalar()
+        return self.query._limit_count(count)
+
+    def _execute(self, kind, params):
+        query = self.query
+        conn = connection.get_connection()
+        if query._using is None:
+            conn = conn.reader(query)
+        else:
+            conn = conn.route(query._using, query)
+
+        statement = self._statements[kind]
+        dialect = getattr(conn, 'dialect', None)
+        if dialect is not None:
+            key = (kind, dialect)
+            compiled = self._compiled.get(key)
+            if compiled is None:
+                compiled = statement.compile(dialect=dialect)
+                self._compiled[key] = compiled
+            statement = compiled
+
+        return conn.execute(statement, params)
+
+
+class _DeferredLoader(object):
+    """ Loads deferred columns for the instances returned by a query
+
+    Instances are held through weak references so iterating over a
+    large query does not keep the instances alive.
+    """
+
+    BATCH_SIZE = 500
+
+    def __init__(self, query, names):
+        self.model = query.model
+        self.using = query._using
+        self.options = query.stmt.get_execution_options()
+        self.names = frozenset(names)
+        self.instances = []
+
+    def add(self, instance):
+        instance._deferred = set(self.names)
+        instance._deferred_loader = self
+        self.instances.append(weakref.ref(instance))
+
+    def load(self, name):
+        """ Load column `name` for every instance still missing it
+        """
+        alive = [ref() for ref in self.instances]
+        alive = [i for i in alive if i is not None and i._deferred]
+        instances = [i for i in alive if name in i._deferred]
+        self.instances = [weakref.ref(i) for i in alive
+                          if i._deferred.difference([name])]
+
+        table = self.model.get_table()
+        key_name = self.model.get_key_name()
+        key_columns = [table.columns[k] for k in key_name]
+
+        for start in range(0, len(instances), self.BATCH_SIZE):
+            batch = instances[start:start + self.BATCH_SIZE]
+
+            by_key = {}
+            for instance in batch:
+                key = tuple(getattr(instance, k) for k in key_name)
+                by_key.setdefault(key, []).append(instance)
+
+            if len(key_columns) == 1:
+                clause = key_columns[0].in_([k[0] for k in by_key])
+            else:
+                clause = sqlalchemy.tuple_(*key_columns).in_(list(by_key))
+
+            query = Query(self.model,
+                          columns=key_columns + [table.columns[name]])
+            query.where(clause)
+            query._using = self.using
+            query.stmt = query.stmt.execution_options(**self.options)
+
+            for row in query.execute():
+                key = tuple(row[k] for k in key_name)
+                for instance in by_key.get(key, []):
+                    setattr(instance, name, row[name])
+
+            # rows deleted in the meantime keep the default value
+            for instance in batch:
+                instance._deferred.discard(name)
+
+
+class _Join(object):
+    """ A reference joined by `Query.join`
+    """
+
+    def __init__(self, field, outer):
+        self.field = field
+        self.outer = outer
+        self.model = field.reference
+        self.cache_name = 'cache_%s' % field.name
+
+        table = self.model.get_table()
+        key_name = self.model.get_key_name()
+        self.deferred = set(
+            c.name for c in self.model.get_columns().values()
+            if getattr(c, 'deferred', False) and c.name not in key_name)
+
+        self.labels = {}
+        self.columns = []
+        for column in table.columns:
+            if column.name in self.deferred:
+                continue
+            label = '%s__%s' % (field.name, column.name)
+            self.labels[column.name] = label
+            self.columns.append(column.label(label))
+
+    def join(self, model, clause):
+        """ Join the referenced table of `model` to `clause`
+        """
+        child = model.get_table()
+        table = self.model.get_table()
+        columns = self.field.get_fk_columns().keys()
+        fk_columns = self.model.get_key_name()
+
+        onclause = sqlalchemy.and_(*[
+            child.columns[column] == table.columns[fk_column]
+            for column, fk_column in zip(columns, fk_columns)
+        ])
+        return clause.join(table, onclause, isouter=self.outer)
+
+    def loader(self, query):
+        if not self.deferred:
+            return None
+
+        ref_query = self.model.select()
+        ref_query._using = query._using
+        return _DeferredLoader(ref_query, self.deferred)
+
+    def load(self, row, loader):
+        """ Referenced instance of `row`, `None` if the outer join found
+        no row
+        """
+        values = {name: row[label] for name, label in self.labels.items()}
+        key = [values[k] for k in self.model.get_key_name()]
+        if all(value is None for value in key):
+            return None
+
+        instance = self.model(**values)
+        if loader is not None:
+            loader.add(instance)
+
+        return instance
+
+
+# Jobs of `_parallel_scan` which are inherited by the forked processes
+_parallel_jobs = {}
+
+
+def _parallel_scan(queries, func, workers, reduce):
+    """ Scan every query in a pool of forked processes
+
+    Yields the list of results of every query as they complete, or
+    with `reduce` a `(found, value)` tuple where `found` is `False`
+    for queries without rows.
+    """
+    job_id = uuid.uuid4().hex
+    _parallel_jobs[job_id] = (queries, func, reduce)
+    try:
+        context = multiprocessing.get_context('fork')
+        pool = context.Pool(min(workers, len(queries)),
+                            initializer=_init_worker)
+        try:
+            tasks = [(job_id, i) for i in range(len(queries))]
+            for result in pool.imap_unordered(_scan_partition, tasks):
+                yield result
+        finally:
+            pool.terminate()
+            pool.join()
+    finally:
+        del _parallel_jobs[job_id]
+
+
+def _init_worker():
+    connection.get_connection().dispose()
+
+
+def _scan_partition(task):
+    job_id, index = task
+    queries, func, reduce = _parallel_jobs[job_id]
+
+    results = (func(instance) for instance in queries[index])
+    if reduce is None:
+        return list(results)
+
+    for first in results:
+        return True, functools.reduce(reduce, results, first)
+
+    return False, None
@@ -0,0 +1,201 @@
+"""
+Write-behind buffering of inserts.
+
+>>> class Event(Model):
+        name = StringField()
+
+        write_behind = WriteBehind(batch_size=500, interval=1.0)
+
+`Event(name='login').save()` puts the row on a queue and returns, a
+background thread inserts the queued rows in batches.
+"""
+
+import time
+import atexit
+import logging
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from mangrove import exceptions
+from mangrove import connection
+
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindMetrics(object):
+    """ Counters of a `WriteBehind` buffer
+
+    Latencies are the seconds between `save` and the commit of the
+    row.
+    """
+
+    def __init__(self):
+        self.flushes = 0
+        self.rows = 0
+        self.errors = 0
+        self.last_flush_duration = 0.0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self._total_latency = 0.0
+
+    def __repr__(self):
+        return (
+            "WriteBehindMetrics(flushes=%s, rows=%s, errors=%s, "
+            "average_latency=%.4f, max_latency=%.4f)" % (
+                self.flushes, self.rows, self.errors,
+                self.average_latency, self.max_latency))
+
+    @property
+    def average_latency(self):
+        if not self.rows:
+            return 0.0
+
+        return self._total_latency / self.rows
+
+
+class WriteBehind(object):
+    """ Queue inserts and write them in batches from a background thread
+
+    Set it as `write_behind` on a model, or on a connection to buffer
+    the inserts of every model written to it. `Model.save` then
+    enqueues the row and returns `None`, the primary key of rows with
+    an automatic key is not set on the instance. Saves inside
+    `Connection.transaction` are written immediately.
+
+    :param int batch_size: Queued rows which trigger a flush, and the
+        maximum number of rows per `executemany`
+    :param float interval: Seconds after which queued rows are flushed
+    :param int max_queue: Maximum number of queued rows
+    :param float timeout: Seconds `save` waits for room in a full
+        queue before raising `exceptions.QueueFullError`, `None` waits
+        forever
+    :param on_error: Callable receiving the exception and the rows of a
+        batch which could not be written. Errors are logged if it is
+        not given.
+
+    Rows are flushed at exit and by `flush()`. Metrics are available
+    in `metrics`, see `WriteBehindMetrics`.
+
+    The background thread opens its own DB connections, an in memory
+    SQLite database is not visible to it.
+    """
+
+    def __init__(self, batch_size=500, interval=1.0, max_queue=10000,
+                 timeout=None, on_error=None):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.timeout = timeout
+        self.on_error = on_error
+        self.metrics = WriteBehindMetrics()
+
+        self._queue = queue.Queue(max_queue)
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def enqueue(self, instance):
+        """ Queue the insert of model `instance`
+        """
+        self._start()
+
+        data = dict((p, getattr(instance, p)) for p in instance.get_columns())
+        writer = connection.get_connection().writer(instance)
+        item = (writer, instance.get_table(), data, time.time())
+        try:
+            self._queue.put(item, timeout=self.timeout)
+        except queue.Full:
+            raise exceptions.QueueFullError(
+                "Write-behind queue is full (%s rows)" % self._queue.maxsize)
+
+        if self._queue.qsize() >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self):
+        """ Write all the queued rows
+        """
+        with self._flush_lock:
+            while True:
+                items = []
+                while len(items) < self.batch_size:
+                    try:
+                        items.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                if not items:
+                    break
+
+                self._write(items)
+
+    def close(self):
+        """ Stop the background thread and write the queued rows
+        """
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        self.flush()
+
+    def _start(self):
+        if self._thread is not None:
+            return
+
+        with self._start_lock:
+            if self._thread is None:
+                self._stopped.clear()
+                thread = threading.Thread(target=self._run)
+                thread.daemon = True
+                thread.start()
+                self._thread = thread
+                atexit.register(self.close)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def _write(self, items):
+        started = time.time()
+
+        groups = {}
+        for writer, table, data, enqueued in items:
+            # executemany needs the same columns in every row
+            key = (id(writer), table.name, frozenset(data))
+            groups.setdefault(key, (writer, table, [], []))
+            groups[key][2].append(data)
+            groups[key][3].append(enqueued)
+
+        metrics = self.metrics
+        for writer, table, rows, enqueued in groups.values():
+            try:
+                with writer.transaction():
+                    writer.execute(table.insert(), rows)
+            except Exception as e:
+                metrics.errors += 1
+                if self.on_error is not None:
+                    self.on_error(e, rows)
+                else:
+                    logger.exception("Write-behind insert into `%s` of %s "
+                                     "rows failed", table.name, len(rows))
+                continue
+
+            now = time.time()
+            latencies = [now - t for t in enqueued]
+            metrics.rows += len(rows)
+            metrics.last_latency = max(latencies)
+            metrics.max_latency = max(metrics.max_latency,
+                                      metrics.last_latency)
+            metrics._total_latency += sum(latencies)
+
+        metrics.flushes += 1
+        metrics.last_flush_duration = time.time() - started
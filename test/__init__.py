@@ -1,3 +1,6 @@
+import os
+import shutil
+import tempfile
 import unittest
 from mangrove import connection
 
@@ -5,3 +8,27 @@ from mangrove import connection
 class BaseTestCase(unittest.TestCase):
     def setUp(self):
         connection.get_connection().drop_all()
+
+
+class FileConnectionTestCase(BaseTestCase):
+    """ Runs the tests on SQLite databases in a temporary directory
+
+    The default connection is restored after every test.
+    """
+
+    def setUp(self):
+        super(FileConnectionTestCase, self).setUp()
+        self.default = connection.get_connection()
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        connection.get_connection().drop_all()
+        connection.install_connection(self.default)
+        shutil.rmtree(self.tmpdir)
+
+    def sqlite(self, name, **kwargs):
+        """ Connection to the database file `name` in the temporary
+        directory
+        """
+        path = os.path.join(self.tmpdir, '%s.db' % name)
+        return connection.SqliteConnection(path, **kwargs)
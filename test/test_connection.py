@@ -1,10 +1,15 @@
+import os
 import mock
+import threading
+import sqlalchemy
 
 import test
 
 from mangrove import models
 from mangrove import fields
+from mangrove import query
 from mangrove import connection
+from mangrove import exceptions
 
 
 class AddModelTestCase(test.BaseTestCase):
@@ -71,3 +76,392 @@ class MultipleConnectionTestCase(test.BaseTestCase):
         persons = Person.select().fetch()
         self.assertEqual(len(persons), 1)
         self.assertEqual(persons[0].name, 'Umair')
+
+
+class TransactionTestCase(test.BaseTestCase):
+    def test_commit_and_rollback(self):
+        class Person(models.Model):
+            name = fields.StringField()
+
+        conn = connection.get_connection()
+        with conn.transaction():
+            Person(name='Umair').save()
+            self.assertTrue(conn.in_transaction())
+            self.assertEqual(Person.select().count(), 1)
+
+        self.assertFalse(conn.in_transaction())
+        self.assertEqual(Person.select().count(), 1)
+
+        try:
+            with conn.transaction():
+                Person(name='Khan').save()
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+
+        self.assertEqual(Person.select().count(), 1)
+
+
+class RoutingConnectionTestCase(test.FileConnectionTestCase):
+    def setUp(self):
+        super(RoutingConnectionTestCase, self).setUp()
+        self.primary = self.sqlite('primary')
+        self.replicas = [self.sqlite('replica0'), self.sqlite('replica1')]
+
+    def install(self, **kwargs):
+        router = connection.RoutingConnection(
+            self.primary, self.replicas, **kwargs)
+        connection.install_connection(router)
+
+        class Person(models.Model):
+            name = fields.StringField()
+
+        return Person
+
+    def test_routing(self):
+        Person = self.install()
+        Person(name='Umair').save()
+
+        # writes go to the primary, the replicas are never written to
+        self.assertEqual(Person.select().count(), 0)
+        self.assertEqual(Person.select().fetch(), [])
+        self.assertEqual(Person.select().using('primary').count(), 1)
+        self.assertEqual(
+            Person.select().using('primary').get().name, 'Umair')
+
+        # reads inside a transaction go to the primary
+        with connection.get_connection().transaction():
+            self.assertEqual(Person.select().count(), 1)
+
+        self.assertRaises(
+            ValueError, lambda: Person.select().using('foo').count())
+
+    def test_cached_count(self):
+        Person = self.install()
+        Person(name='Umair').save()
+
+        # replicated outside of mangrove
+        self.replicas[0].execute(
+            Person.get_table().insert().values(name='Umair'))
+
+        self.assertEqual(Person.select().count(cache=True), 1)
+        self.assertEqual(Person.select().count(cache=True), 0)
+        self.assertEqual(Person.select().count(cache=True), 1)
+        self.assertEqual(
+            Person.select().using('primary').count(cache=True), 1)
+
+    def test_get_many(self):
+        Person = self.install()
+        for replica in self.replicas:
+            replica.execute(Person.get_table().insert(),
+                            [{'name': 'p%s' % i} for i in range(3)])
+
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        for replica in self.replicas:
+            sqlalchemy.event.listen(
+                replica._engine, 'before_cursor_execute', record)
+
+        # replicas are read only, no temporary table is created
+        people = Person.get_many([1, 2, 4], temp_table_threshold=1)
+        self.assertEqual(people[(2,)].name, 'p1')
+        self.assertIsNone(people[(4,)])
+        self.assertTrue(statements)
+        self.assertFalse([s for s in statements if 'TEMPORARY' in s])
+
+    def test_round_robin(self):
+        Person = self.install()
+        self.replicas[1].execute(
+            Person.get_table().insert().values(name='Khan'))
+
+        counts = [Person.select().count() for i in range(4)]
+        self.assertEqual(counts, [0, 1, 0, 1])
+
+    def test_least_loaded(self):
+        Person = self.install(policy='least_loaded')
+        router = connection.get_connection()
+        readers = [router.reader().connection for i in range(4)]
+        self.assertEqual(readers, self.replicas * 2)
+
+        router._load[0] = 5
+        self.assertIs(router.reader().connection, self.replicas[1])
+        self.assertIs(router.reader().connection, self.replicas[1])
+
+    def test_health_and_lag(self):
+        lag = {id(self.replicas[0]): 0, id(self.replicas[1]): 30}
+        Person = self.install(
+            lag_check=lambda replica: lag[id(replica)],
+            max_lag=10,
+            check_interval=0)
+        router = connection.get_connection()
+
+        for i in range(3):
+            self.assertIs(router.reader().connection, self.replicas[0])
+
+        lag[id(self.replicas[0])] = 30
+        self.assertIs(router.reader(), self.primary)
+
+        router.health_check = lambda replica: False
+        lag[id(self.replicas[0])] = 0
+        self.assertIs(router.reader(), self.primary)
+
+
+class ShardedConnectionTestCase(test.FileConnectionTestCase):
+    def setUp(self):
+        super(ShardedConnectionTestCase, self).setUp()
+        self.shards = [self.sqlite('shard%s' % i) for i in range(3)]
+        connection.install_connection(
+            connection.ShardedConnection(self.shards))
+
+        class Event(models.Model):
+            user_id = fields.IntegerField(primary_key=True)
+            name = fields.StringField()
+
+            shard_key = 'user_id'
+
+        for i in range(9):
+            Event(user_id=i, name='event%s' % (i % 4)).save()
+
+        self.Event = Event
+
+    def shard_count(self, index):
+        stmt = sqlalchemy.select([sqlalchemy.func.count()])
+        stmt = stmt.select_from(self.Event.get_table())
+        return self.shards[index].execute(stmt).scalar()
+
+    def test_writes_are_routed(self):
+        Event = self.Event
+        self.assertEqual([self.shard_count(i) for i in range(3)], [3, 3, 3])
+
+        event = Event.get_by_key({Event.user_id: 4})
+        event.name = 'updated'
+        event.update()
+        self.assertEqual(Event.get_by_key({Event.user_id: 4}).name,
+                         'updated')
+
+        event.delete()
+        self.assertEqual([self.shard_count(i) for i in range(3)], [3, 2, 3])
+        self.assertIsNone(Event.get_by_key({Event.user_id: 4}))
+
+        self.assertRaises(ValueError, lambda: Event(name='foo').save())
+
+    def test_transaction(self):
+        sharded = connection.get_connection()
+        self.assertRaises(exceptions.NotSupportedError, sharded.transaction)
+
+        with self.shards[1].transaction():
+            self.Event(user_id=10, name='event2').save()
+        self.assertEqual(self.shard_count(1), 4)
+
+    def test_fan_out(self):
+        Event = self.Event
+        self.assertEqual(Event.select().count(), 9)
+        self.assertEqual(Event.select().where(Event.name == 'event1').count(),
+                         2)
+
+        query = Event.select().order_by(Event.user_id)
+        self.assertEqual([e.user_id for e in query], list(range(9)))
+
+        query = Event.select().order_by(Event.user_id.desc())
+        self.assertEqual([e.user_id for e in query[2:5]], [6, 5, 4])
+        self.assertEqual(query.limit(3).count(), 3)
+
+        query = Event.select().order_by(Event.user_id)
+        self.assertEqual([e.user_id for e in query[2:]], list(range(2, 9)))
+        self.assertEqual([e.user_id for e in query.offset(2).fetch()],
+                         list(range(2, 9)))
+        self.assertEqual(query.offset(2).count(), 7)
+
+        query = Event.select().order_by(Event.name, -Event.user_id)
+        self.assertEqual([e.user_id for e in query.fetch(3)], [8, 4, 0])
+
+        self.assertTrue(Event.select().where(Event.name == 'event3').exists())
+        self.assertFalse(Event.select().where(Event.name == 'foo').exists())
+
+    def test_targeted(self):
+        Event = self.Event
+        sharded = connection.get_connection()
+
+        query = Event.select().where(Event.user_id == 5)
+        self.assertEqual(sharded.shard_indexes(query), [2])
+        self.assertEqual(query.get().user_id, 5)
+
+        query = Event.select().where(Event.user_id.in_([1, 4, 2]))
+        self.assertEqual(sharded.shard_indexes(query), [1, 2])
+        self.assertEqual(query.count(), 3)
+
+        query = Event.select().where(Event.name == 'event1')
+        query.where(Event.user_id == 1)
+        self.assertEqual(sharded.shard_indexes(query), [1])
+
+        query = Event.select().where(Event.name == 'event1')
+        self.assertEqual(sharded.shard_indexes(query), [0, 1, 2])
+
+    def test_prepared(self):
+        Event = self.Event
+        prepared = Event.select().where(
+            Event.name == sqlalchemy.bindparam('name')
+        ).order_by(Event.user_id).prepare()
+
+        self.assertEqual([e.user_id for e in prepared.fetch(name='event1')],
+                         [1, 5])
+        self.assertEqual(prepared.count(name='event0'), 3)
+
+        prepared = Event.select().where(
+            Event.user_id == sqlalchemy.bindparam('user_id')).prepare()
+        self.assertEqual(prepared.get(user_id=7).name, 'event3')
+
+    def test_shard_function(self):
+        class Account(models.Model):
+            name = fields.StringField(primary_key=True)
+
+            shard_key = 'name'
+            shard_function = staticmethod(lambda value, num: len(value) % num)
+
+        Account(name='abcd').save()
+        Account(name='ab').save()
+
+        self.assertEqual(Account.get_shard('abcd', 3), 1)
+        self.assertEqual(Account.select().count(), 2)
+        self.assertEqual(
+            Account.select().where(Account.name == 'ab').get().name, 'ab')
+
+    def test_statement(self):
+        stmt = sqlalchemy.select([sqlalchemy.func.count()])
+        stmt = stmt.select_from(self.Event.get_table())
+
+        statement = query.SelectStatement(stmt=stmt)
+        self.assertEqual(statement.execute().scalar(), 3)
+        self.assertEqual(
+            statement.using('primary').execute().scalar(), 3)
+
+    def test_shard_key_field(self):
+        class Account(models.Model):
+            shard_key = fields.IntegerField(primary_key=True)
+
+        Account(shard_key=1).save()
+        Account(shard_key=2).save()
+        # not sharded, all the rows are on the first shard
+        self.assertEqual(Account.select().count(), 2)
+
+        with self.assertRaises(ValueError):
+            class Other(Account):
+                shard_key = 'shard_key'
+
+
+class SqliteConnectionTestCase(test.FileConnectionTestCase):
+    def test_profile(self):
+        path = os.path.join(self.tmpdir, 'profile.db')
+        conn = connection.SqliteConnection(
+            path, profile='throughput', pragmas={'cache_size': -1000})
+
+        def pragma(name):
+            return conn.execute('PRAGMA %s' % name).scalar()
+
+        self.assertEqual(pragma('journal_mode'), 'wal')
+        self.assertEqual(pragma('synchronous'), 0)
+        self.assertEqual(pragma('temp_store'), 2)
+        self.assertEqual(pragma('busy_timeout'), 5000)
+        self.assertEqual(pragma('cache_size'), -1000)
+
+        self.assertRaises(ValueError,
+                          lambda: connection.SqliteConnection(profile='foo'))
+        self.assertRaises(ValueError,
+                          lambda: connection.SqliteConnection(path,
+                                                              shared=True))
+
+    def test_shared_memory(self):
+        connection.install_connection(
+            connection.SqliteConnection(shared=True, profile='balanced'))
+
+        class Person(models.Model):
+            name = fields.StringField()
+
+        Person(name='Umair').save()
+
+        counts = []
+
+        def count():
+            Person(name='Khan').save()
+            counts.append(Person.select().count())
+
+        thread = threading.Thread(target=count)
+        thread.start()
+        thread.join()
+
+        self.assertEqual(counts, [2])
+        self.assertEqual(Person.select().count(), 2)
+
+    def test_shared_memory_pooled(self):
+        conn = connection.SqliteConnection(shared=True)
+        connection.install_connection(conn)
+
+        class Person(models.Model):
+            name = fields.StringField()
+
+        connects = []
+        sqlalchemy.event.listen(
+            conn._engine, 'connect', lambda *args: connects.append(args))
+        for i in range(5):
+            Person(name='p%s' % i).save()
+
+        self.assertEqual(connects, [])
+        self.assertEqual(Person.select().count(), 5)
+
+
+class StatementTimeoutTestCase(test.FileConnectionTestCase):
+    # counts to a billion unless interrupted
+    SLOW = sqlalchemy.text(
+        "(WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c "
+        "LIMIT 1000000000) SELECT count(*) FROM c) > 0")
+
+    def setUp(self):
+        super(StatementTimeoutTestCase, self).setUp()
+
+        # pooled, the same DB connection is reused after a timeout
+        self.conn = self.sqlite('timeout', profile='balanced', pool_size=1)
+        connection.install_connection(self.conn)
+
+        class Person(models.Model):
+            name = fields.StringField()
+
+        Person(name='Umair').save()
+        self.Person = Person
+
+    def test_query_timeout(self):
+        query = self.Person.select().where(self.SLOW).timeout(0.1)
+        self.assertRaises(exceptions.QueryTimeoutError, query.fetch)
+        self.assertRaises(exceptions.QueryTimeoutError, query.count)
+        self.assertRaises(exceptions.QueryTimeoutError, query.exists)
+
+        # the DB connection is back in the pool without the handler
+        self.assertEqual(self.conn._engine.pool.checkedout(), 0)
+        people = self.Person.select().timeout(5).fetch()
+        self.assertEqual([p.name for p in people], ['Umair'])
+        self.assertEqual(self.Person.select().get().name, 'Umair')
+
+    def test_connection_timeout(self):
+        self.conn.statement_timeout = 0.1
+        query = self.Person.select().where(self.SLOW)
+        self.assertRaises(exceptions.QueryTimeoutError, query.get)
+        self.assertEqual(self.Person.select().count(), 1)
+
+        def save():
+            with self.conn.transaction():
+                self.Person(name='Khan').save()
+                query.fetch()
+
+        self.assertRaises(exceptions.QueryTimeoutError, save)
+        self.assertEqual(self.Person.select().count(), 1)
+
+        conn = connection.SqliteConnection(statement_timeout=2)
+        self.assertEqual(conn.statement_timeout, 2)
+
+    def test_unsupported_dialect(self):
+        query = self.Person.select().timeout(1)
+        with mock.patch.object(connection.SqliteConnection, 'dialect_name',
+                               'oracle'):
+            self.assertRaises(exceptions.NotSupportedError, query.fetch)
@@ -1,7 +1,17 @@
+import io
+import json
+import datetime
+import time
+import operator
+import sqlalchemy
+
 import test
 from mangrove import models
 from mangrove import fields
+from mangrove import advisor
 from mangrove import connection
+from mangrove import exceptions
+from mangrove import writebehind
 
 
 class DateTimeFieldTestCase(test.BaseTestCase):
@@ -242,3 +252,933 @@ class ModelTestCase(test.BaseTestCase):
 
         self.assertEqual(Person.select().order_by('age').get().age, 0)
         self.assertEqual(Person.select().order_by('-age').get().age, 9)
+
+
+class LimitOffsetTestCase(test.BaseTestCase):
+
+    def setUp(self):
+        super(LimitOffsetTestCase, self).setUp()
+
+        class Person(models.Model):
+            name = fields.StringField()
+            age = fields.IntegerField()
+
+        for i in range(10):
+            Person(name='umair', age=i).save()
+
+        self.Person = Person
+
+    def test_limit_offset(self):
+        Person = self.Person
+        query = Person.select().order_by(Person.age).offset(2).limit(3)
+        self.assertEqual([p.age for p in query], [2, 3, 4])
+        self.assertEqual(query.count(), 3)
+
+        sql = str(query.stmt)
+        self.assertIn('LIMIT', sql)
+        self.assertIn('OFFSET', sql)
+
+    def test_slicing(self):
+        Person = self.Person
+        query = Person.select().order_by(Person.age)
+        self.assertEqual([p.age for p in query[3:6]], [3, 4, 5])
+        self.assertEqual([p.age for p in query[8:]], [8, 9])
+        self.assertEqual([p.age for p in query[:2]], [0, 1])
+        self.assertEqual(query[4].age, 4)
+        self.assertRaises(IndexError, lambda: query[10])
+        self.assertRaises(ValueError, lambda: query[::2])
+        self.assertRaises(ValueError, lambda: query[-1])
+
+        # slicing does not modify the original query
+        self.assertEqual(query.count(), 10)
+
+        # slices compose with the offset and limit of the query
+        query = Person.select().order_by(Person.age).offset(5)
+        self.assertEqual([p.age for p in query[2:4]], [7, 8])
+        self.assertEqual(query[1].age, 6)
+
+        query = Person.select().order_by(Person.age).offset(2).limit(3)
+        self.assertEqual([p.age for p in query[1:]], [3, 4])
+        self.assertEqual([p.age for p in query[1:10]], [3, 4])
+        self.assertEqual(query[5:], [])
+        self.assertRaises(IndexError, lambda: query[3])
+
+    def test_fetch_size(self):
+        query = self.Person.select()
+        self.assertEqual(len(query.fetch(4)), 4)
+        self.assertEqual(len(query.fetch()), 10)
+        self.assertEqual(len(query.limit(3).fetch(10)), 3)
+        self.assertEqual(len(query.fetch(2)), 2)
+
+    def test_get_is_limited(self):
+        statements = []
+        engine = connection.get_connection()._engine
+        listener = lambda *args: statements.append((args[2], args[3]))
+        sqlalchemy.event.listen(engine, 'before_cursor_execute', listener)
+        self.addCleanup(sqlalchemy.event.remove, engine,
+                        'before_cursor_execute', listener)
+
+        query = self.Person.select().order_by(self.Person.age)
+        self.assertEqual(query.get().age, 0)
+        self.assertIsNone(query.stmt._limit_clause)
+
+        # LIMIT ? OFFSET ? with SQLite
+        [(sql, params)] = statements
+        self.assertIn('LIMIT ?', sql)
+        self.assertEqual(params[-2:], (1, 0))
+
+    def test_exists(self):
+        Person = self.Person
+        self.assertTrue(Person.select().exists())
+        self.assertTrue(Person.select().where(Person.age == 3).exists())
+        self.assertFalse(Person.select().where(Person.age == 30).exists())
+
+
+class DeferredFieldTestCase(test.BaseTestCase):
+
+    def setUp(self):
+        super(DeferredFieldTestCase, self).setUp()
+
+        class Post(models.Model):
+            title = fields.StringField()
+            summary = fields.StringField()
+            body = fields.StringField(deferred=True)
+
+        for i in range(5):
+            Post(title='t%s' % i, summary='s%s' % i, body='b%s' % i).save()
+
+        self.Post = Post
+
+    def test_deferred_field(self):
+        Post = self.Post
+        query = Post.select().order_by(Post.id)
+        self.assertNotIn('body', str(query.stmt))
+
+        posts = query.fetch()
+        self.assertFalse(hasattr(posts[0], '_prop__body'))
+        self.assertEqual(posts[1].body, 'b1')
+
+        # loaded for all the posts of the query at once
+        self.assertTrue(all(hasattr(p, '_prop__body') for p in posts))
+        self.assertEqual([p.body for p in posts], ['b0', 'b1', 'b2', 'b3',
+                                                   'b4'])
+
+    def test_defer_and_only(self):
+        Post = self.Post
+        query = Post.select().defer(Post.summary)
+        sql = str(query.stmt)
+        self.assertNotIn('summary', sql)
+        self.assertIn('title', sql)
+
+        query = Post.select().only('title', 'body')
+        sql = str(query.stmt)
+        self.assertNotIn('summary', sql)
+        self.assertIn('body', sql)
+        self.assertIn('id', sql)
+
+        post = query.where(Post.id == 3).get()
+        self.assertEqual(post.body, 'b2')
+        self.assertEqual(post.summary, 's2')
+
+        post = Post.select().defer('title').where(Post.id == 3).get()
+        self.assertEqual(post.title, 't2')
+        self.assertEqual(post.body, 'b2')
+
+    def test_update_skips_deferred(self):
+        Post = self.Post
+        post = Post.select().only('title').where(Post.id == 1).get()
+        post.title = 'new title'
+        post.summary = 'new summary'
+        post.update()
+
+        post = Post.select().only(
+            Post.title, Post.summary, Post.body).where(Post.id == 1).get()
+        self.assertEqual(post.title, 'new title')
+        self.assertEqual(post.summary, 'new summary')
+        self.assertEqual(post.body, 'b0')
+
+
+class StorageTestCase(test.BaseTestCase):
+
+    def test_slots(self):
+        class Parent(models.Model):
+            name = fields.StringField()
+
+        class Base(models.Model):
+            abstract = True
+            name = fields.StringField()
+
+        class Child(Base):
+            abstract = False
+            age = fields.IntegerField()
+            parent = fields.ReferenceField(Parent)
+
+        parent = Parent(name='parent')
+        parent.save()
+        Child(name='child', age=3, parent=parent).save()
+
+        child = Child.select().get()
+        self.assertFalse(hasattr(child, '__dict__'))
+        self.assertEqual(child.name, 'child')
+        self.assertEqual(child.age, 3)
+        self.assertEqual(child.parent.name, 'parent')
+        self.assertEqual(child.fk_parent_id, parent.id)
+        self.assertRaises(AttributeError, lambda: setattr(child, 'foo', 1))
+
+        class Loose(models.Model):
+            __slots__ = ('__dict__',)
+            name = fields.StringField()
+
+        loose = Loose(name='loose')
+        loose.foo = 1
+        self.assertEqual(loose.foo, 1)
+        self.assertEqual(loose.name, 'loose')
+        self.assertIn('_prop__name', loose.__dict__)
+
+    def test_multiple_bases(self):
+        class Named(models.Model):
+            name = fields.StringField()
+
+        class Aged(models.Model):
+            age = fields.IntegerField()
+
+        with self.assertRaises(TypeError) as cm:
+            class Person(Named, Aged):
+                pass
+        self.assertIn("__slots__ = ('__dict__',)", str(cm.exception))
+
+        class LooseNamed(models.Model):
+            __slots__ = ('__dict__',)
+            name = fields.StringField()
+
+        class LooseAged(models.Model):
+            __slots__ = ('__dict__',)
+            age = fields.IntegerField()
+
+        class Person(LooseNamed, LooseAged):
+            pass
+
+        person = Person(name='person', age=3)
+        self.assertEqual((person.name, person.age), ('person', 3))
+
+
+class GetManyTestCase(test.BaseTestCase):
+
+    def test_get_many(self):
+        class Person(models.Model):
+            name = fields.StringField()
+
+        for i in range(10):
+            Person(name='person%s' % i).save()
+
+        people = Person.get_many([1, 3, (5,), 42], chunk_size=2)
+        self.assertEqual(sorted(people), [(1,), (3,), (5,), (42,)])
+        self.assertEqual(people[(3,)].name, 'person2')
+        self.assertEqual(people[(5,)].name, 'person4')
+        self.assertIsNone(people[(42,)])
+
+        people = Person.get_many(range(1, 12), temp_table_threshold=5)
+        self.assertEqual(len(people), 11)
+        self.assertEqual(people[(10,)].name, 'person9')
+        self.assertIsNone(people[(11,)])
+
+        # keys are converted to the type of the key field
+        people = Person.get_many(['1', 2])
+        self.assertEqual(sorted(people), [(1,), (2,)])
+        self.assertEqual(people[(1,)].name, 'person0')
+        self.assertRaises(ValueError, lambda: Person.get_many(['one']))
+
+    def test_composite_key(self):
+        class Score(models.Model):
+            game = fields.StringField(primary_key=True)
+            player = fields.StringField(primary_key=True)
+            points = fields.IntegerField()
+
+        Score(game='chess', player='umair', points=3).save()
+        Score(game='chess', player='khan', points=5).save()
+        Score(game='go', player='umair', points=7).save()
+
+        keys = [('chess', 'khan'), ('go', 'umair'), ('go', 'khan')]
+        for threshold in (10, 1):
+            scores = Score.get_many(keys, temp_table_threshold=threshold)
+            self.assertEqual(scores[('chess', 'khan')].points, 5)
+            self.assertEqual(scores[('go', 'umair')].points, 7)
+            self.assertIsNone(scores[('go', 'khan')])
+
+        self.assertRaises(ValueError, lambda: Score.get_many(['chess']))
+
+
+class ReverseReferenceTestCase(test.BaseTestCase):
+
+    def setUp(self):
+        super(ReverseReferenceTestCase, self).setUp()
+
+        class Parent(models.Model):
+            name = fields.StringField()
+
+        class Child(models.Model):
+            name = fields.StringField()
+            parent = fields.ReferenceField(Parent)
+
+        class Pet(models.Model):
+            name = fields.StringField()
+            owner = fields.ReferenceField(Parent, related_name='pets')
+
+        self.parents = [Parent(name='p%s' % i) for i in range(3)]
+        for i, parent in enumerate(self.parents):
+            parent.save()
+            for j in range(i):
+                Child(name='c%s%s' % (i, j), parent=parent).save()
+
+        Pet(name='rex', owner=self.parents[0]).save()
+
+        self.Parent = Parent
+        self.Child = Child
+
+    def test_accessor(self):
+        Child = self.Child
+        p0, p1, p2 = self.parents
+        self.assertEqual(p0.child_set.count(), 0)
+        self.assertEqual(p2.child_set.count(), 2)
+        self.assertEqual(
+            [c.name for c in p2.child_set.order_by(Child.name)],
+            ['c20', 'c21'])
+        self.assertEqual(p0.pets.get().name, 'rex')
+        self.assertFalse(p1.pets.exists())
+
+    def test_prefetch_related(self):
+        Parent, Child = self.Parent, self.Child
+        query = Parent.select().order_by(Parent.id)
+        parents = query.prefetch_related('child_set', 'pets').fetch()
+
+        self.assertEqual(parents[0]._prefetched['child_set'], [])
+        self.assertEqual(len(parents[2]._prefetched['child_set']), 2)
+
+        children = parents[2].child_set
+        self.assertEqual(children.count(), 2)
+        self.assertEqual(
+            sorted(c.name for c in children), ['c20', 'c21'])
+        self.assertEqual(parents[0].pets.get().name, 'rex')
+
+        # modified queries are executed
+        children.where(Child.name == 'c20')
+        self.assertEqual(children.count(), 1)
+
+        self.assertRaises(
+            ValueError, lambda: Parent.select().prefetch_related('name'))
+
+    def test_counts(self):
+        counts = self.Parent.child_set.counts(self.parents)
+        self.assertEqual(counts, {(1,): 0, (2,): 1, (3,): 2})
+
+    def test_unsaved_parent(self):
+        self.Child(name='orphan').save()
+        parent = self.Parent(name='unsaved')
+        self.assertEqual(parent.child_set.fetch(), [])
+        self.assertEqual(parent.child_set.count(), 0)
+
+    def test_name_clash(self):
+        Parent = self.Parent
+
+        def define(related_name):
+            class Toy(models.Model):
+                owner = fields.ReferenceField(
+                    Parent, related_name=related_name)
+
+        self.assertRaises(ValueError, define, 'name')
+        self.assertRaises(ValueError, define, 'pets')
+        self.assertRaises(ValueError, define, 'save')
+        self.assertEqual(Parent(name='x').name, 'x')
+
+    def test_subclass(self):
+        Child = self.Child
+
+        class SpecialChild(Child):
+            pass
+
+        # `child_set` keeps returning `Child` rows
+        parent = self.parents[2]
+        self.assertIs(self.Parent.child_set.model, Child)
+        self.assertFalse(hasattr(self.Parent, 'specialchild_set'))
+        self.assertEqual(parent.child_set.count(), 2)
+
+        class Base(models.Model):
+            abstract = True
+            owner = fields.ReferenceField(self.Parent, related_name='toys')
+
+        class Toy(Base):
+            abstract = False
+
+        def define():
+            class Game(Base):
+                abstract = False
+
+        self.assertIs(self.Parent.toys.model, Toy)
+        self.assertRaises(ValueError, define)
+
+
+class BulkLoadTestCase(test.BaseTestCase):
+
+    def setUp(self):
+        super(BulkLoadTestCase, self).setUp()
+
+        class Person(models.Model):
+            name = fields.StringField()
+            age = fields.IntegerField()
+            active = fields.BooleanField()
+            born = fields.DateTimeField()
+
+        self.Person = Person
+
+    def test_load_csv(self):
+        data = io.StringIO(
+            'id,name,age,active,born,unknown\n'
+            '1,umair,32,true,1985-01-02 03:04:05,x\n'
+            '2,khan,,0,,x\n'
+            '3,broken,abc,yes,,x\n'
+            '4,late,40,no,2000-01-01T00:00:00,x\n')
+
+        rejects = []
+        reports = []
+        report = self.Person.load_csv(
+            data, batch_size=2, on_reject=lambda *r: rejects.append(r),
+            progress=reports.append)
+
+        self.assertEqual(report.rows, 3)
+        self.assertEqual(report.rejected, 1)
+        self.assertEqual(report.rejects[0][0], 4)
+        self.assertEqual(len(rejects), 1)
+        self.assertEqual(len(reports), 2)
+        self.assertTrue(report.rows_per_second > 0)
+
+        Person = self.Person
+        people = Person.select().order_by(Person.id).fetch()
+        self.assertEqual([p.name for p in people], ['umair', 'khan', 'late'])
+        self.assertEqual(people[0].born, datetime.datetime(1985, 1, 2, 3, 4, 5))
+        self.assertIs(people[0].active, True)
+        self.assertIsNone(people[1].age)
+        self.assertIs(people[2].active, False)
+
+    def test_load_jsonl(self):
+        data = io.StringIO(
+            '{"name": "umair", "age": 32}\n'
+            '\n'
+            'not json\n'
+            '{"name": "khan", "active": true}\n')
+
+        report = self.Person.load_jsonl(data)
+        self.assertEqual(report.rows, 2)
+        self.assertEqual(report.rejected, 1)
+        self.assertEqual(self.Person.select().count(), 2)
+
+        data = io.StringIO(
+            '{"id": 1, "name": "updated", "age": 33}\n'
+            '{"id": 9, "name": "new"}\n')
+        report = self.Person.load_jsonl(data, upsert=True)
+        self.assertEqual(report.rows, 2)
+        self.assertEqual(self.Person.select().count(), 3)
+        self.assertEqual(self.Person.get_many([1])[(1,)].name, 'updated')
+
+    def test_rollback(self):
+        data = io.StringIO('{"id": 1, "name": "a"}\n{"id": 1, "name": "b"}\n')
+        self.assertRaises(sqlalchemy.exc.IntegrityError,
+                          lambda: self.Person.load_jsonl(data, batch_size=1))
+        self.assertEqual(self.Person.select().count(), 0)
+
+
+class ExportTestCase(test.BaseTestCase):
+
+    def setUp(self):
+        super(ExportTestCase, self).setUp()
+
+        class Person(models.Model):
+            name = fields.StringField()
+            active = fields.BooleanField()
+            born = fields.DateTimeField()
+
+        born = datetime.datetime(1985, 1, 2, 3, 4, 5)
+        Person(name='umair', active=True, born=born).save()
+        Person(name='khan', active=False).save()
+        Person(name='doe').save()
+
+        self.Person = Person
+
+    def test_to_jsonl(self):
+        fp = io.StringIO()
+        query = self.Person.select().order_by(self.Person.id)
+        self.assertEqual(query.to_jsonl(fp, chunk_size=2), 3)
+
+        rows = [json.loads(l) for l in fp.getvalue().splitlines()]
+        self.assertEqual(rows[0], {'id': 1, 'name': 'umair', 'active': True,
+                                   'born': '1985-01-02T03:04:05'})
+        self.assertEqual(rows[2]['born'], None)
+
+        # round trip
+        fp.seek(0)
+        self.Person.select().get().delete()
+        self.assertEqual(self.Person.load_jsonl(fp, upsert=True).rows, 3)
+        self.assertEqual(self.Person.get_many([1])[(1,)].born.year, 1985)
+
+    def test_to_csv(self):
+        fp = io.StringIO()
+        query = self.Person.select().where(self.Person.name != 'doe')
+        self.assertEqual(query.only('name', 'active').to_csv(fp), 2)
+        self.assertEqual(fp.getvalue().splitlines(), [
+            'name,active,id', 'umair,true,1', 'khan,false,2'])
+
+
+def _square_age(person):
+    return person.age ** 2
+
+
+class ParallelScanTestCase(test.FileConnectionTestCase):
+
+    def setUp(self):
+        super(ParallelScanTestCase, self).setUp()
+        connection.install_connection(self.sqlite('parallel'))
+
+        class Person(models.Model):
+            name = fields.StringField()
+            age = fields.IntegerField()
+
+        for i in range(20):
+            Person(name='umair' if i % 2 else 'khan', age=i).save()
+
+        self.Person = Person
+
+    def test_partitions(self):
+        Person = self.Person
+        query = Person.select().where(Person.name == 'umair')
+        partitions = query.partitions(3)
+        self.assertEqual(len(partitions), 3)
+        self.assertEqual([p.count() for p in partitions], [3, 3, 4])
+
+        ages = sorted(p.age for part in partitions for p in part)
+        self.assertEqual(ages, list(range(1, 20, 2)))
+
+        self.assertEqual(len(Person.select().partitions(50)), 20)
+        self.assertRaises(ValueError,
+                          lambda: Person.select().limit(2).partitions(2))
+
+    def test_parallel_map(self):
+        query = self.Person.select()
+        results = query.parallel_map(_square_age, workers=2)
+        self.assertEqual(sorted(results), [i ** 2 for i in range(20)])
+
+        total = query.where(self.Person.age < 10).parallel_map(
+            lambda p: p.age, workers=3, reduce=operator.add, initial=0)
+        self.assertEqual(total, 45)
+
+        # `initial` is used once, not once per partition
+        query = self.Person.select()
+        total = query.parallel_map(lambda p: 1, workers=2, partitions=4,
+                                   reduce=operator.add, initial=100)
+        self.assertEqual(total, 120)
+        total = query.parallel_map(lambda p: 1, workers=2, partitions=4,
+                                   reduce=operator.add)
+        self.assertEqual(total, 20)
+
+        query = self.Person.select().where(self.Person.age > 100)
+        self.assertEqual(query.parallel_map(
+            lambda p: 1, reduce=operator.add, initial=7), 7)
+
+
+class WriteBehindTestCase(test.FileConnectionTestCase):
+
+    def setUp(self):
+        super(WriteBehindTestCase, self).setUp()
+        connection.install_connection(self.sqlite('events'))
+
+    def test_write_behind(self):
+        buffer = writebehind.WriteBehind(batch_size=3, interval=60)
+
+        class Event(models.Model):
+            name = fields.StringField()
+
+            write_behind = buffer
+
+        self.assertIsNone(Event(name='e0').save())
+        Event(name='e1').save()
+        self.assertEqual(Event.select().count(), 0)
+
+        # the third row wakes up the flusher
+        Event(name='e2').save()
+        for i in range(100):
+            if Event.select().count() == 3:
+                break
+            time.sleep(0.01)
+        self.assertEqual(Event.select().count(), 3)
+
+        Event(name='e3').save()
+        buffer.flush()
+        self.assertEqual(Event.select().count(), 4)
+        self.assertEqual(buffer.metrics.rows, 4)
+        self.assertTrue(buffer.metrics.max_latency > 0)
+
+        # saves in a transaction are written immediately
+        with connection.get_connection().transaction():
+            Event(name='e4').save()
+        self.assertEqual(Event.select().count(), 5)
+
+        buffer.close()
+
+    def test_backpressure_and_errors(self):
+        errors = []
+        buffer = writebehind.WriteBehind(
+            batch_size=10, interval=60, max_queue=2, timeout=0.01,
+            on_error=lambda e, rows: errors.append(rows))
+        connection.get_connection().write_behind = buffer
+
+        class Event(models.Model):
+            name = fields.StringField(primary_key=True)
+
+        Event(name='a').save()
+        Event(name='a').save()
+        self.assertRaises(exceptions.QueueFullError,
+                          lambda: Event(name='b').save())
+
+        buffer.close()
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(buffer.metrics.errors, 1)
+        self.assertEqual(Event.select().count(), 0)
+
+    def test_write_behind_field(self):
+        buffer = writebehind.WriteBehind(batch_size=10, interval=60)
+        connection.get_connection().write_behind = buffer
+
+        class Event(models.Model):
+            write_behind = fields.BooleanField()
+
+        Event(write_behind=True).save()
+        self.assertEqual(Event.select().count(), 0)
+        buffer.flush()
+        self.assertTrue(Event.select().get().write_behind)
+        buffer.close()
+
+        with self.assertRaises(ValueError):
+            class Other(Event):
+                write_behind = buffer
+
+
+class ValidationModeTestCase(test.BaseTestCase):
+
+    def tearDown(self):
+        fields.set_validation_mode(fields.STRICT)
+
+    def test_modes(self):
+        class Person(models.Model):
+            name = fields.StringField()
+            age = fields.IntegerField()
+
+        self.assertRaises(ValueError, lambda: Person(age='32'))
+
+        fields.set_validation_mode(fields.OFF)
+        person = Person(name='Umair', age='32')
+        self.assertEqual(person.age, '32')
+
+        fields.set_validation_mode(fields.DEFERRED)
+        person = Person(name='Umair', age='32')
+        self.assertRaises(ValueError, person.save)
+        self.assertEqual(Person.select().count(), 0)
+
+        person.age = 32
+        person.save()
+        self.assertEqual(Person.select().count(), 1)
+
+        person.name = 1
+        self.assertRaises(ValueError, person.update)
+
+        self.assertRaises(ValueError,
+                          lambda: fields.set_validation_mode('foo'))
+
+    def test_model_mode(self):
+        class Person(models.Model):
+            name = fields.StringField()
+            validation = fields.OFF
+
+        Person(name=1)
+        self.assertRaises(ValueError, Person(name=1).validate)
+
+    def test_validation_field(self):
+        class Check(models.Model):
+            validation = fields.StringField()
+
+        check = Check(validation='manual')
+        self.assertRaises(ValueError, lambda: setattr(check, 'validation', 1))
+        check.save()
+        self.assertEqual(Check.select().get().validation, 'manual')
+
+        with self.assertRaises(ValueError):
+            class Other(Check):
+                validation = fields.OFF
+
+        with self.assertRaises(ValueError):
+            class Unknown(models.Model):
+                validation = 'foo'
+
+    def test_save_many(self):
+        class Person(models.Model):
+            name = fields.StringField()
+            age = fields.IntegerField()
+            validation = fields.DEFERRED
+
+        people = [Person(name='p%s' % i, age=i) for i in range(5)]
+        people.append(Person(name='bad', age='5'))
+        self.assertRaises(ValueError, lambda: Person.save_many(people))
+        self.assertEqual(Person.select().count(), 0)
+
+        people[-1].age = 5
+        Person.save_many(people, batch_size=2)
+        self.assertEqual(Person.select().count(), 6)
+        self.assertEqual(
+            Person.select().order_by(Person.age).get().name, 'p0')
+
+
+class AdvisorTestCase(test.BaseTestCase):
+
+    def setUp(self):
+        super(AdvisorTestCase, self).setUp()
+
+        class Person(models.Model):
+            name = fields.StringField()
+            age = fields.IntegerField()
+            city = fields.StringField(index=True)
+
+        self.Person = Person
+
+    def test_explain(self):
+        Person = self.Person
+        plan = Person.select().where(Person.name == 'Foobar').explain()
+        self.assertEqual(plan.full_scans, ['Person'])
+        self.assertFalse(plan.temp_sorts)
+        self.assertTrue(plan.steps[0]['detail'].startswith('SCAN'))
+
+        plan = Person.select().where(Person.id == 1).explain()
+        self.assertEqual(plan.full_scans, [])
+
+        plan = Person.select().where(Person.city == 'Lahore').explain()
+        self.assertEqual(plan.full_scans, [])
+
+        plan = Person.select().order_by(Person.age).explain()
+        self.assertTrue(plan.temp_sorts)
+
+    def test_suggest_indexes(self):
+        Person = self.Person
+        with advisor.Workload() as workload:
+            for i in range(3):
+                Person.select().where(Person.name == 'p%s' % i).fetch()
+            Person.select().where(Person.name == 'p').where(
+                Person.age > 3).count()
+            Person.select().where(Person.city == 'Lahore').fetch()
+            Person.select().where(Person.id == 1).get()
+            Person.select().order_by(-Person.age).fetch()
+
+        Person.select().where(Person.age == 3).fetch()
+        self.assertEqual(len(workload.shapes), 5)
+
+        suggestions = advisor.suggest_indexes(workload)
+        self.assertEqual(
+            [(s.columns, s.queries, s.reason) for s in suggestions],
+            [(('name',), 3, 'full scan'),
+             (('name', 'age'), 1, 'full scan'),
+             (('age',), 1, 'sort')])
+        self.assertEqual(suggestions[0].sql,
+                         'CREATE INDEX ix_Person_name ON "Person" ("name")')
+        self.assertIn('index=True', suggestions[0].definition)
+
+
+class PreparedQueryTestCase(test.BaseTestCase):
+
+    def test_prepare(self):
+        class Person(models.Model):
+            name = fields.StringField()
+            age = fields.IntegerField()
+            bio = fields.StringField(deferred=True)
+
+        for i in range(6):
+            Person(name='umair' if i % 2 else 'khan', age=i, bio='b').save()
+
+        prepared = Person.select().where(
+            Person.name == sqlalchemy.bindparam('name')
+        ).where(
+            Person.age >= sqlalchemy.bindparam('age')
+        ).order_by(-Person.age).prepare()
+
+        people = prepared.fetch(name='umair', age=2)
+        self.assertEqual([p.age for p in people], [5, 3])
+        self.assertEqual(people[0].bio, 'b')
+        self.assertEqual(prepared.get(name='khan', age=0).age, 4)
+        self.assertIsNone(prepared.get(name='doe', age=0))
+        self.assertEqual(prepared.count(name='khan', age=1), 2)
+
+        # compiled once per kind of statement
+        self.assertEqual(len(prepared._compiled), 3)
+        prepared.fetch(name='khan', age=0)
+        self.assertEqual(len(prepared._compiled), 3)
+
+        limited = Person.select().where(
+            Person.name == sqlalchemy.bindparam('name')).limit(2).prepare()
+        self.assertEqual(len(limited.fetch(name='khan')), 2)
+        self.assertEqual(limited.count(name='khan'), 2)
+
+
+class JoinTestCase(test.BaseTestCase):
+
+    def setUp(self):
+        super(JoinTestCase, self).setUp()
+
+        class Parent(models.Model):
+            name = fields.StringField()
+            bio = fields.StringField(deferred=True)
+
+        class Child(models.Model):
+            name = fields.StringField()
+            parent = fields.ReferenceField(Parent)
+
+        self.Parent, self.Child = Parent, Child
+
+        self.parents = [Parent(name='parent%s' % i, bio='bio%s' % i)
+                        for i in range(2)]
+        for parent in self.parents:
+            parent.save()
+
+        for i in range(4):
+            Child(name='child%s' % i, parent=self.parents[i % 2]).save()
+        Child(name='orphan').save()
+
+    def count_statements(self):
+        statements = []
+        engine = connection.get_connection()._engine
+        listener = lambda *args: statements.append(args[2])
+        sqlalchemy.event.listen(engine, 'before_cursor_execute', listener)
+        self.addCleanup(sqlalchemy.event.remove, engine,
+                        'before_cursor_execute', listener)
+        return statements
+
+    def test_join(self):
+        Parent, Child = self.Parent, self.Child
+        query = Child.select().join(Child.parent).order_by(Child.name)
+
+        statements = self.count_statements()
+        children = query.fetch()
+        self.assertEqual([c.name for c in children],
+                         ['child0', 'child1', 'child2', 'child3'])
+        self.assertEqual([c.parent.name for c in children],
+                         ['parent0', 'parent1', 'parent0', 'parent1'])
+        self.assertEqual(len(statements), 1)
+
+        # deferred columns of the reference are loaded on access
+        self.assertEqual(children[1].parent.bio, 'bio1')
+
+        query = Child.select().join('parent').where(Parent.name == 'parent1')
+        self.assertEqual(query.count(), 2)
+        self.assertEqual(sorted(c.name for c in query),
+                         ['child1', 'child3'])
+
+        self.assertRaises(ValueError, lambda: Child.select().join('name'))
+
+    def test_outer_join(self):
+        Child = self.Child
+        query = Child.select().join(Child.parent, outer=True)
+        query.order_by(Child.name)
+
+        statements = self.count_statements()
+        children = query.fetch()
+        self.assertEqual(len(children), 5)
+        self.assertIsNone(children[-1].parent)
+        self.assertEqual(children[0].parent.name, 'parent0')
+        self.assertEqual(len(statements), 1)
+
+        self.assertEqual(query.count(), 5)
+        self.assertEqual(Child.select().join(Child.parent).count(), 4)
+
+    def test_tuples(self):
+        Child = self.Child
+        query = Child.select().join(Child.parent, outer=True).tuples()
+        query.defer(Child.name).order_by(Child.id)
+
+        pairs = query.fetch()
+        self.assertEqual([(c.name, p and p.name) for c, p in pairs], [
+            ('child0', 'parent0'), ('child1', 'parent1'),
+            ('child2', 'parent0'), ('child3', 'parent1'),
+            ('orphan', None),
+        ])
+        self.assertEqual(query[1][1].name, 'parent1')
+
+
+class CountTestCase(test.BaseTestCase):
+
+    def setUp(self):
+        super(CountTestCase, self).setUp()
+
+        class Person(models.Model):
+            name = fields.StringField()
+            age = fields.IntegerField()
+
+        for i in range(10):
+            Person(name='person%s' % i, age=i).save()
+
+        self.Person = Person
+        self.conn = connection.get_connection()
+
+    def test_approximate(self):
+        Person = self.Person
+
+        # not analyzed yet, counted exactly
+        self.assertEqual(Person.select().count(approximate=True), 10)
+
+        self.conn.execute('ANALYZE')
+        Person(name='person10', age=10).save()
+
+        # statistics are not updated by the insert
+        self.assertEqual(Person.select().count(approximate=True), 10)
+        self.assertEqual(Person.select().limit(4).count(approximate=True), 4)
+        self.assertEqual(Person.select().count(), 11)
+
+        query = Person.select().where(Person.age < 5)
+        self.assertEqual(query.count(approximate=True), 5)
+
+    def test_cache(self):
+        Person = self.Person
+        query = Person.select().where(Person.age >= 5)
+        self.assertEqual(query.count(cache=True), 5)
+
+        # writes made outside of mangrove are not seen
+        self.conn.execute("DELETE FROM Person WHERE age = 9")
+        self.assertEqual(query.count(cache=True), 5)
+        self.assertEqual(query.count(), 4)
+
+        other = Person.select().where(Person.age >= 7)
+        self.assertEqual(other.count(cache=True), 2)
+
+        Person(name='person10', age=10).save()
+        self.assertEqual(query.count(cache=True), 5)
+        self.assertEqual(other.count(cache=True), 3)
+
+        person = Person.select().where(Person.age == 10).get()
+        person.delete()
+        self.assertEqual(query.count(cache=True), 4)
+
+        with self.conn.transaction():
+            Person.select().get().delete()
+            Person.select().get().delete()
+        self.assertEqual(Person.select().count(cache=True), 7)
+
+    def test_cache_concurrent_write(self):
+        Person = self.Person
+        counted = []
+
+        def count(conn, cursor, statement, *args):
+            # another thread counting while the insert runs
+            if statement.startswith('INSERT') and not counted:
+                counted.append(Person.select().count(cache=True))
+
+        engine = self.conn._engine
+        sqlalchemy.event.listen(engine, 'before_cursor_execute', count)
+        try:
+            Person(name='person10', age=10).save()
+        finally:
+            sqlalchemy.event.remove(engine, 'before_cursor_execute', count)
+
+        self.assertEqual(counted, [10])
+        self.assertEqual(Person.select().count(cache=True), 11)